@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+
+class SemanticAnswerCache:
+    """LRU cache of generated answers keyed by query embedding.
+
+    A lookup hits when a cached query is within `threshold` cosine similarity of
+    the new one, so paraphrases of a common question reuse the same answer.
+    Entries expire after `ttl_seconds`, and the whole cache is dropped when the
+    index version it was filled from changes.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 256):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.index_version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, index_version: Optional[str]):
+        if index_version != self.index_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.index_version = index_version
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, query_vector: list[float], index_version: Optional[str]) -> Optional[str]:
+        vector = np.asarray(query_vector, dtype = np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        with self._lock:
+            self._check_version(index_version)
+            self._expire(time.time())
+            if self._entries:
+                keys = list(self._entries)
+                matrix = np.stack([self._entries[key]["vector"] for key in keys])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry = self._entries[keys[best]]
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    self.saved_seconds += entry["latency"]
+                    return entry["answer"]
+            self.misses += 1
+            return None
+
+    def put(self, query_vector: list[float], index_version: Optional[str], answer: str, latency: float):
+        vector = np.asarray(query_vector, dtype = np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[self._next_id] = {
+                "vector": vector,
+                "answer": answer,
+                "latency": latency,
+                "created": time.time()
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "index_version": self.index_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+            "saved_seconds": self.saved_seconds
+        }
@@ -0,0 +1,44 @@
+import json
+import os
+import time
+from typing import Callable
+
+def tune_batch_size(encode: Callable[[list[str], int], object], texts: list[str], candidates: list[int],
+                    repeats: int = 2) -> tuple[int, dict[int, float]]:
+    """Time `encode(texts, batch_size)` for every candidate size.
+
+    Returns the fastest size and the texts/sec measured for each one. Every size
+    gets the best of `repeats` runs, after one untimed warm-up call so that
+    model loading and first-call allocation are not charged to the first size.
+    """
+    if not texts:
+        raise ValueError("No texts to tune the batch size on")
+    encode(texts[:min(candidates)], min(candidates))
+    rates = {}
+    for size in candidates:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            encode(texts, size)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        rates[size] = len(texts) / max(best, 1e-9)
+    return max(rates, key = rates.get), rates
+
+def load_tuned_sizes(path: str) -> dict:
+    """Saved tuning results ({model: {device: {"batch_size": n, "texts_per_sec": {...}}}}), or {}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_tuned_size(path: str, model_name: str, device: str, batch_size: int, rates: dict[int, float]):
+    tuned = load_tuned_sizes(path)
+    tuned.setdefault(model_name, {})[device] = {
+        "batch_size": batch_size,
+        "texts_per_sec": {str(size): round(rate, 1) for size, rate in rates.items()},
+        "tuned_at": time.time()
+    }
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(tuned, f, indent = 2)
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,55 @@
+"""Compare /ask/batch latency with sequential and concurrent execution against a fake LLM.
+
+With concurrency the batch should take roughly the slowest single question
+rather than the sum. Requires a built database (python model.py --build).
+Run from the repository root:
+    python benchmarks/bench_ask_batch.py --delay 0.5 --questions 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_ask_concurrency import QUESTIONS, SlowFakeChatModel, disable_answer_cache
+
+import model
+import server
+
+
+async def run(concurrency: int, questions: list[str]):
+    server.BATCH_CONCURRENCY = concurrency
+    model.llm_slots = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    response = await server.ask_batch_questions(server.BatchQuestionRequest(questions = questions))
+    assert [r['question'] for r in response.results] == questions
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark /ask/batch with a fake LLM")
+    parser.add_argument('--delay', type = float, default = 0.5, help = 'Fake generation time in seconds')
+    parser.add_argument('--questions', type = int, default = 8)
+    args = parser.parse_args()
+
+    if not model.vector_store.exists():
+        sys.exit("Database not found! Please run 'python model.py --build' first.")
+
+    fake = SlowFakeChatModel(responses = ["FINAL ANSWER: fake answer.\nSOURCES: fake.pdf"], delay = args.delay)
+    model.get_llm = lambda: fake
+    model.embeddings.embed_query(QUESTIONS[0])
+    disable_answer_cache()
+    server.rag_system_ready = True
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.questions)]
+    print(f"{'concurrency':>11} {'questions':>9} {'seconds':>8}")
+    for concurrency in (1, args.questions):
+        seconds = asyncio.run(run(concurrency, questions))
+        print(f"{concurrency:>11} {len(questions):>9} {seconds:>8.2f}")
+    print(f"single question LLM delay: {args.delay:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Load test for ask_questions against a local fake LLM.
+
+The fake chat model sleeps for a fixed generation delay, so throughput should
+scale with concurrency (up to LLM_CONCURRENCY) when the chain runs asynchronously.
+Requires a built database (python model.py --build). Run from the repository root:
+    python benchmarks/bench_ask_concurrency.py --delay 0.5 --concurrency 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import model
+
+QUESTIONS = [
+    "What is the total DOE budget request for FY 2025?",
+    "How much funding is requested for the Office of Science?",
+    "What is the NNSA request?",
+    "How much is requested for ARPA-E?",
+]
+
+
+class SlowFakeChatModel(FakeListChatModel):
+    delay: float = 0.5
+
+    def _generate(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return super()._generate(*args, **kwargs)
+
+    async def _agenerate(self, *args, **kwargs):
+        await asyncio.sleep(self.delay)
+        return super()._generate(*args, **kwargs)
+
+
+def disable_answer_cache():
+    # Every request must reach the fake LLM; repeated questions would otherwise be answered from the cache.
+    model.answer_cache.threshold = float('inf')
+    model.answer_cache.clear()
+
+
+async def run(concurrency: int, requests: int):
+    model.llm_slots = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*[model.ask_questions(QUESTIONS[i % len(QUESTIONS)]) for i in range(requests)])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark /ask throughput with a fake LLM")
+    parser.add_argument('--delay', type = float, default = 0.5, help = 'Fake generation time in seconds')
+    parser.add_argument('--requests', type = int, default = 16)
+    parser.add_argument('--concurrency', type = int, nargs = '+', default = [1, 2, 4, 8])
+    args = parser.parse_args()
+
+    if not model.vector_store.exists():
+        sys.exit("Database not found! Please run 'python model.py --build' first.")
+
+    fake = SlowFakeChatModel(responses = ["FINAL ANSWER: fake answer.\nSOURCES: fake.pdf"], delay = args.delay)
+    model.get_llm = lambda: fake
+    model.embeddings.embed_query(QUESTIONS[0])
+    disable_answer_cache()
+
+    print(f"{'concurrency':>11} {'requests':>8} {'seconds':>8} {'req/sec':>8}")
+    for concurrency in args.concurrency:
+        seconds = asyncio.run(run(concurrency, args.requests))
+        print(f"{concurrency:>11} {args.requests:>8} {seconds:>8.2f} {args.requests / seconds:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
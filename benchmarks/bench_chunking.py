@@ -0,0 +1,90 @@
+"""Index size, build time and retrieval recall of the overlapping and parent/child chunking modes.
+
+Each mode is built from scratch into a temporary index with an empty embedding
+cache, so build times include every embedding. A question counts as recalled
+when the retrieved context contains one of its expected strings from eval_set.json.
+Run from the repository root:
+    python benchmarks/bench_chunking.py --k 3 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model
+from embedding_cache import CachedEmbeddings
+from vector_store import VectorStoreManager
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eval_set.json')
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def build(chunking: str, workdir: str):
+    model.embeddings = CachedEmbeddings(
+        model.embedding_model,
+        model_name = model.embedding_model_id(),
+        path = os.path.join(workdir, 'embedding_cache.sqlite3')
+    )
+    model.vector_store = VectorStoreManager(os.path.join(workdir, 'chroma'), model.embeddings)
+    model._index_artifacts.clear()
+    start = time.perf_counter()
+    asyncio.run(model.build_database(chunking = chunking))
+    return time.perf_counter() - start
+
+
+def evaluate(eval_set: list[dict], mode: str, k: int):
+    db = model.vector_store.get()
+    recalled = 0
+    context_chars = []
+    for item in eval_set:
+        docs = model.retrieve(db, item["question"], k, mode = mode)
+        context_chars.append(sum(len(doc.page_content) for doc in docs))
+        if any(expected in doc.page_content for doc in docs for expected in item["expected"]):
+            recalled += 1
+    return recalled / len(eval_set), statistics.median(context_chars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark overlapping vs parent/child chunking")
+    parser.add_argument('--k', type = int, nargs = '+', default = [3, 5])
+    args = parser.parse_args()
+
+    with open(EVAL_SET) as f:
+        eval_set = json.load(f)
+
+    # Load the embedding model up front so the first build isn't charged for it.
+    model.embedding_model.load()
+
+    rows = []
+    for chunking in model.CHUNKING_MODES:
+        with tempfile.TemporaryDirectory() as workdir:
+            seconds = build(chunking, workdir)
+            db = model.vector_store.get()
+            chunks = len(db.get(include = [])['ids'])
+            size = directory_size(model.vector_store.current_path())
+            for k in args.k:
+                for mode in model.RETRIEVAL_MODES:
+                    recall, chars = evaluate(eval_set, mode, k)
+                    rows.append((chunking, chunks, size, seconds, mode, k, recall, chars))
+            model.vector_store.close()
+
+    print(f"\n{'chunking':>8} {'chunks':>7} {'index MB':>9} {'build s':>8} {'mode':>8} {'k':>3} {'recall':>7} {'context chars':>14}")
+    for chunking, chunks, size, seconds, mode, k, recall, chars in rows:
+        print(f"{chunking:>8} {chunks:>7} {size / 1e6:>9.2f} {seconds:>8.1f} {mode:>8} {k:>3} {recall:>7.2f} {chars:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
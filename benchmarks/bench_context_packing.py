@@ -0,0 +1,73 @@
+"""Prompt size, generation latency and answer accuracy with and without context packing.
+
+An answer counts as accurate when it contains one of the question's expected
+strings from eval_set.json. Needs a built database and a running Ollama server;
+pass --no-llm to only compare context sizes.
+Run from the repository root:
+    python benchmarks/bench_context_packing.py --budget 1500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eval_set.json')
+
+
+def unpacked(docs, token_budget = None):
+    return docs
+
+
+async def evaluate(eval_set: list[dict], use_llm: bool):
+    db = model.vector_store.get()
+    context_tokens = []
+    latencies = []
+    accurate = 0
+    for item in eval_set:
+        qa_chain = model.build_qa_chain(db)
+        docs = await qa_chain.retriever.ainvoke(item["question"])
+        context_tokens.append(sum(model.estimate_tokens(doc.page_content) for doc in docs))
+        if not use_llm:
+            continue
+        start = time.perf_counter()
+        response = await qa_chain.ainvoke({"question": item["question"]})
+        latencies.append(time.perf_counter() - start)
+        answer = response.get('answer', '')
+        if any(expected in answer for expected in item["expected"]):
+            accurate += 1
+    return context_tokens, latencies, accurate
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark token-budgeted context packing")
+    parser.add_argument('--budget', type = int, default = model.CONTEXT_TOKEN_BUDGET)
+    parser.add_argument('--no-llm', action = 'store_true', help = 'Only compare context sizes')
+    args = parser.parse_args()
+
+    if not model.vector_store.exists():
+        sys.exit("Database not found! Please run 'python model.py --build' first.")
+
+    with open(EVAL_SET) as f:
+        eval_set = json.load(f)
+
+    model.CONTEXT_TOKEN_BUDGET = args.budget
+    packer = model.pack_context
+    print(f"{'context':>8} {'median tokens':>14} {'median s':>9} {'accuracy':>9}")
+    for name, pack in (('stuffed', unpacked), ('packed', packer)):
+        model.pack_context = pack
+        tokens, latencies, accurate = asyncio.run(evaluate(eval_set, not args.no_llm))
+        latency = f"{statistics.median(latencies):>9.2f}" if latencies else f"{'-':>9}"
+        accuracy = f"{accurate}/{len(eval_set)}" if latencies else '-'
+        print(f"{name:>8} {statistics.median(tokens):>14.0f} {latency} {accuracy:>9}")
+    model.pack_context = packer
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Embedding throughput per model batch size, with chunks batched in document order or sorted by length.
+
+Chunks are cut into upsert batches exactly as the build does (plan_batches) and
+each batch is embedded with the raw model, bypassing the embedding cache.
+Run from the repository root:
+    python benchmarks/bench_embedding_batches.py --sizes 16 32 64 --chunking overlap
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark embedding batch sizes and batch ordering")
+    parser.add_argument('--sizes', type = int, nargs = '+', default = list(model.EMBEDDING_BATCH_CANDIDATES))
+    parser.add_argument('--upsert-batch-size', type = int, default = model.INGEST_BATCH_SIZE)
+    parser.add_argument('--chunking', choices = model.CHUNKING_MODES, default = model.CHUNKING_MODE)
+    parser.add_argument('--repeats', type = int, default = 2)
+    args = parser.parse_args()
+
+    pages = asyncio.run(model.load_data())
+    chunks, _ = model.split_pages(pages, args.chunking, verbose = False)
+    items = [(model.chunk_id(chunk), chunk) for chunk in chunks]
+    embedder = model.embedding_model.load()
+    embedder.embed_documents([chunk.page_content for chunk in chunks[:8]])
+
+    print(f"\n{len(chunks)} chunks ({args.chunking}), upsert batches of {args.upsert_batch_size}, "
+          f"device {model.device_profile(model.embedding_device())}")
+    print(f"{'batch size':>10} {'order':>8} {'seconds':>8} {'chunks/s':>9}")
+    for size in args.sizes:
+        embedder.encode_kwargs['batch_size'] = size
+        for order in model.BATCH_ORDERS:
+            batches = model.plan_batches(items, args.upsert_batch_size, order)
+            best = None
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                for batch in batches:
+                    embedder.embed_documents([chunk.page_content for _, chunk in batch])
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{size:>10} {order:>8} {best:>8.2f} {len(chunks) / best:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
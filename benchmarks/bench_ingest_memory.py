@@ -0,0 +1,72 @@
+"""Peak RSS and wall time of the streaming build against the load-everything-then-save build.
+
+The corpus is grown by feeding the PDF's pages N times under distinct source
+names, so every copy is split, indexed and (after the first) served from the
+embedding cache. Each run happens in a fresh interpreter with an empty index.
+Run from the repository root:
+    python benchmarks/bench_ingest_memory.py --copies 1 2 4 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import asyncio, json, os, resource, sys, tempfile, time
+import model
+from embedding_cache import CachedEmbeddings
+from vector_store import VectorStoreManager
+
+pipeline, copies = sys.argv[1], int(sys.argv[2])
+workdir = tempfile.mkdtemp()
+model.embeddings = CachedEmbeddings(model.embedding_model, model_name = model.embedding_model_id(),
+                                    path = os.path.join(workdir, 'embedding_cache.sqlite3'))
+model.vector_store = VectorStoreManager(os.path.join(workdir, 'chroma'), model.embeddings)
+model.embedding_model.load()
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+async def corpus():
+    for copy in range(copies):
+        async for page in model.iter_pages():
+            page.metadata['source'] = f"{page.metadata['source']}#{copy}"
+            yield page
+
+async def batch():
+    pages = [page async for page in corpus()]
+    chunks, parents = model.split_pages(pages, verbose = False)
+    facts = model.extract_budget_facts(pages)
+    await asyncio.to_thread(model.save_at_chroma, chunks, None, facts, parents)
+
+start = time.perf_counter()
+asyncio.run(model.ingest(corpus()) if pipeline == 'streaming' else batch())
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': elapsed, 'peak_mb': peak / 1024, 'build_mb': (peak - baseline) / 1024}))
+"""
+
+
+def run(pipeline: str, copies: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE, pipeline, str(copies)],
+        cwd = ROOT, capture_output = True, text = True, check = True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark peak memory of streaming vs batch ingestion")
+    parser.add_argument('--copies', type = int, nargs = '+', default = [1, 2, 4])
+    args = parser.parse_args()
+
+    print(f"{'pipeline':>10} {'copies':>7} {'seconds':>8} {'peak MB':>8} {'build MB':>9}")
+    for copies in args.copies:
+        for pipeline in ('batch', 'streaming'):
+            stats = run(pipeline, copies)
+            print(f"{pipeline:>10} {copies:>7} {stats['seconds']:>8.1f} {stats['peak_mb']:>8.0f} {stats['build_mb']:>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
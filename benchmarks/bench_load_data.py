@@ -0,0 +1,56 @@
+"""Compare pages/sec of the sequential PyPDFLoader path against the process-pool extractor.
+
+Extraction always bypasses the page cache; a final row shows the same load served from a warm cache.
+Pass --corpus to measure a directory or manifest of PDFs instead of the single DATA file.
+Run from the repository root:
+    python benchmarks/bench_load_data.py --workers 1 2 4 8
+    python benchmarks/bench_load_data.py --corpus dataset --workers 1 4 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model
+
+
+async def load(workers: int, paths: list[str], use_cache: bool) -> int:
+    return sum([1 async for _ in model.iter_pages(workers, paths, use_cache = use_cache)])
+
+
+def run(workers: int, repeat: int, paths: list[str], use_cache: bool = False):
+    best = float('inf')
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = asyncio.run(load(workers, paths, use_cache))
+        best = min(best, time.perf_counter() - start)
+    return count, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark PDF page extraction")
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--corpus', type = str, default = None, help = 'Directory, manifest or PDF (default: DATA)')
+    args = parser.parse_args()
+
+    paths = model.discover_corpus(args.corpus or model.DATA)
+    print(f"PDFs: {len(paths)} ({args.corpus or model.DATA})")
+    print(f"{'workers':>8} {'pages':>6} {'seconds':>9} {'pages/sec':>10}")
+    for workers in args.workers:
+        count, seconds = run(workers, args.repeat, paths)
+        print(f"{workers:>8} {count:>6} {seconds:>9.3f} {count / seconds:>10.1f}")
+
+    # The first cached load fills the cache; time the warm ones.
+    run(1, 1, paths, use_cache = True)
+    count, seconds = run(1, args.repeat, paths, use_cache = True)
+    print(f"{'cached':>8} {count:>6} {seconds:>9.3f} {count / seconds:>10.1f}")
+    print(f"Page cache: {model.page_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
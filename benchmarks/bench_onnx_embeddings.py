@@ -0,0 +1,114 @@
+"""Throughput and agreement of the int8 ONNX embedding backend against the torch backend.
+
+Embeds every chunk of the PDF and the eval-set questions with both backends
+(raw models, no embedding cache) and reports:
+  - chunks/s and median query latency per backend,
+  - cosine similarity between the two vectors of each chunk, checked against
+    model.ONNX_COSINE_TOLERANCE,
+  - top-k agreement with torch retrieval, both for an index built with ONNX
+    and for ONNX queries against an index built with torch (the mixed case
+    after switching backends without rebuilding), plus eval-set recall.
+Run from the repository root:
+    python benchmarks/bench_onnx_embeddings.py --k 3 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eval_set.json')
+
+
+def load_backend(backend: str):
+    model.EMBEDDING_BACKEND = backend
+    embedder = model.load_embedding_model()
+    embedder.embed_documents(["warm up"])
+    return embedder
+
+
+def embed(embedder, texts: list[str], questions: list[str], repeats: int):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        vectors = embedder.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    latencies = []
+    queries = []
+    for question in questions:
+        start = time.perf_counter()
+        queries.append(embedder.embed_query(question))
+        latencies.append(time.perf_counter() - start)
+    return np.array(vectors), np.array(queries), best, statistics.median(latencies)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis = 1, keepdims = True)
+
+
+def top_k(queries: np.ndarray, docs: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(normalize(queries) @ normalize(docs).T), axis = 1)[:, :k]
+
+
+def recall(hits: np.ndarray, texts: list[str], eval_set: list[dict]) -> float:
+    return sum(
+        any(expected in texts[i] for i in row for expected in item["expected"])
+        for row, item in zip(hits, eval_set)
+    ) / len(eval_set)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the ONNX embedding backend against torch")
+    parser.add_argument('--k', type = int, nargs = '+', default = [3, 5])
+    parser.add_argument('--chunking', choices = model.CHUNKING_MODES, default = model.CHUNKING_MODE)
+    parser.add_argument('--repeats', type = int, default = 2)
+    args = parser.parse_args()
+
+    with open(EVAL_SET) as f:
+        eval_set = json.load(f)
+    questions = [item["question"] for item in eval_set]
+    pages = asyncio.run(model.load_data())
+    chunks, _ = model.split_pages(pages, args.chunking, verbose = False)
+    texts = [chunk.page_content for chunk in chunks]
+
+    results = {}
+    for backend in model.EMBEDDING_BACKENDS:
+        results[backend] = embed(load_backend(backend), texts, questions, args.repeats)
+
+    print(f"\n{len(texts)} chunks ({args.chunking}), {len(questions)} queries")
+    print(f"{'backend':>8} {'chunks/s':>9} {'query ms':>9}")
+    for backend, (_, _, seconds, latency) in results.items():
+        print(f"{backend:>8} {len(texts) / seconds:>9.1f} {latency * 1000:>9.1f}")
+
+    torch_docs, torch_queries = results['torch'][:2]
+    onnx_docs, onnx_queries = results['onnx'][:2]
+    cosines = np.sum(normalize(torch_docs) * normalize(onnx_docs), axis = 1)
+    outside = int(np.sum(1 - cosines > model.ONNX_COSINE_TOLERANCE))
+    print(f"\ncosine(torch, onnx) per chunk: mean {cosines.mean():.4f}, p1 {np.percentile(cosines, 1):.4f}, "
+          f"min {cosines.min():.4f}; {outside} of {len(texts)} outside the tolerance of {model.ONNX_COSINE_TOLERANCE}")
+
+    print(f"\n{'k':>3} {'index':>12} {'overlap@k':>10} {'top-1 same':>11} {'recall':>7}")
+    for k in args.k:
+        reference = top_k(torch_queries, torch_docs, k)
+        runs = (
+            ('torch', reference),
+            ('onnx', top_k(onnx_queries, onnx_docs, k)),
+            ('onnx->torch', top_k(onnx_queries, torch_docs, k))
+        )
+        for name, hits in runs:
+            overlap = statistics.mean(len(set(a) & set(b)) / k for a, b in zip(hits, reference))
+            same = statistics.mean(float(a[0] == b[0]) for a, b in zip(hits, reference))
+            print(f"{k:>3} {name:>12} {overlap:>10.2f} {same:>11.2f} {recall(hits, texts, eval_set):>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
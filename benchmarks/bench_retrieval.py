@@ -0,0 +1,58 @@
+"""Latency and recall of dense, BM25 and hybrid (RRF) retrieval over the eval set.
+
+A question counts as recalled when any of the top-k chunks contains one of its
+expected strings. Requires a database built with the BM25 index (python model.py --build).
+Run from the repository root:
+    python benchmarks/bench_retrieval.py --k 3 5 10
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eval_set.json')
+
+
+def evaluate(db, eval_set: list[dict], mode: str, k: int):
+    latencies = []
+    recalled = 0
+    for item in eval_set:
+        start = time.perf_counter()
+        docs = model.retrieve(db, item["question"], k, mode = mode)
+        latencies.append(time.perf_counter() - start)
+        if any(expected in doc.page_content for doc in docs for expected in item["expected"]):
+            recalled += 1
+    return recalled / len(eval_set), statistics.median(latencies), max(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark dense vs lexical vs hybrid retrieval")
+    parser.add_argument('--k', type = int, nargs = '+', default = [3, 5, 10])
+    args = parser.parse_args()
+
+    if not model.vector_store.exists():
+        sys.exit("Database not found! Please run 'python model.py --build' first.")
+
+    with open(EVAL_SET) as f:
+        eval_set = json.load(f)
+
+    db = model.vector_store.get()
+    # Warm the embedding model, query cache and BM25 load so they don't skew the first timing.
+    model.embeddings.embed_queries([item["question"] for item in eval_set])
+    model.retrieve(db, eval_set[0]["question"], 1, mode = 'hybrid')
+
+    print(f"{'mode':>8} {'k':>3} {'recall':>7} {'median ms':>10} {'max ms':>8}")
+    for k in args.k:
+        for mode in model.RETRIEVAL_MODES:
+            recall, median, worst = evaluate(db, eval_set, mode, k)
+            print(f"{mode:>8} {k:>3} {recall:>7.2f} {median * 1000:>10.2f} {worst * 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Measure startup cost: cold `import model`, first query (loads the embedding model) and warm query.
+
+Each run happens in a fresh interpreter so the import is genuinely cold.
+Run from the repository root:
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import model
+imported = time.perf_counter()
+def query(text):
+    if model.vector_store.exists():
+        model.query_database(text)
+    else:
+        model.embeddings.embed_query(text)
+query('What is the total DOE budget request?')
+first = time.perf_counter()
+query('How much funding goes to the Office of Science?')
+warm = time.perf_counter()
+print(json.dumps({
+    'cold_import': imported - start,
+    'first_query': first - imported,
+    'warm_query': warm - first
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark CLI/server startup time")
+    parser.add_argument('--runs', type = int, default = 5)
+    args = parser.parse_args()
+
+    samples = {'cold_import': [], 'first_query': [], 'warm_query': []}
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd = ROOT, capture_output = True, text = True, check = True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        for key, value in result.items():
+            samples[key].append(value)
+
+    print(f"{'stage':>12} {'median s':>9} {'min s':>7} {'max s':>7}")
+    for key, values in samples.items():
+        print(f"{key:>12} {statistics.median(values):>9.3f} {min(values):>7.3f} {max(values):>7.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""How much chunk text falls outside the embedding model's window, per chunking mode.
+
+all-MiniLM-L6-v2 embeds at most 256 word pieces (254 after [CLS] and [SEP]);
+everything after that is stored in the index but not represented by its vector.
+Only splits the PDF, no database or embedding model is needed.
+Run from the repository root:
+    python benchmarks/bench_truncation.py
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Report embedding-window truncation of each chunking mode")
+    parser.add_argument('--max-tokens', type = int, default = model.EMBEDDING_MAX_TOKENS)
+    args = parser.parse_args()
+
+    window = args.max_tokens - model.SPECIAL_TOKENS
+    pages = asyncio.run(model.load_data())
+    rows = []
+    for chunking in model.CHUNKING_MODES:
+        start = time.perf_counter()
+        chunks, _ = model.split_pages(pages, chunking)
+        seconds = time.perf_counter() - start
+        texts = [chunk.page_content for chunk in chunks]
+        tokens = model.token_counter.count_many(texts)
+        truncated = model.token_counter.truncated_chars(texts, window)
+        rows.append((
+            chunking, len(chunks), seconds,
+            statistics.median(tokens), max(tokens),
+            sum(1 for chars in truncated if chars) / len(chunks),
+            sum(truncated) / sum(len(text) for text in texts)
+        ))
+
+    print(f"\nwindow: {window} word pieces")
+    print(f"{'chunking':>8} {'chunks':>7} {'split s':>8} {'median tok':>11} {'max tok':>8} {'truncated':>10} {'chars lost':>11}")
+    for chunking, count, seconds, median, worst, share, lost in rows:
+        print(f"{chunking:>8} {count:>7} {seconds:>8.2f} {median:>11.0f} {worst:>8} {share:>10.1%} {lost:>11.1%}")
+
+
+if __name__ == '__main__':
+    main()
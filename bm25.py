@@ -0,0 +1,95 @@
+import gzip
+import json
+import math
+import re
+from collections import Counter, defaultdict
+
+# Keeps acronyms like "arpa-e" and figures like "8.6" or "450,000" as single tokens.
+TOKEN_PATTERN = re.compile(r"\d[\d,.]*\d|\d|[a-z0-9]+(?:-[a-z0-9]+)*")
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """Okapi BM25 inverted index over chunk texts, addressed by chunk ID.
+
+    Persisted as gzip-compressed JSON holding the ID list, document lengths and,
+    per term, parallel lists of document positions and term frequencies.
+    """
+
+    def __init__(self, ids: list[str], doc_lengths: list[int], postings: dict[str, tuple[list[int], list[int]]],
+                 k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avg_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    def add(self, doc_id: str, text: str):
+        """Append one document, e.g. while chunks stream in during a build"""
+        tokens = tokenize(text)
+        position = len(self.ids)
+        self.ids.append(doc_id)
+        self.doc_lengths.append(len(tokens))
+        self.avg_length += (len(tokens) - self.avg_length) / len(self.ids)
+        for term, tf in Counter(tokens).items():
+            docs, tfs = self.postings.setdefault(term, ([], []))
+            docs.append(position)
+            tfs.append(tf)
+
+    def remove(self, doc_ids: set[str]):
+        """Drop documents, e.g. the chunks of a file that failed partway through a build"""
+        kept = [position for position, doc_id in enumerate(self.ids) if doc_id not in doc_ids]
+        if len(kept) == len(self.ids):
+            return
+        new_positions = {old: new for new, old in enumerate(kept)}
+        self.ids = [self.ids[position] for position in kept]
+        self.doc_lengths = [self.doc_lengths[position] for position in kept]
+        self.avg_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        postings = {}
+        for term, (docs, tfs) in self.postings.items():
+            pairs = [(new_positions[position], tf) for position, tf in zip(docs, tfs) if position in new_positions]
+            if pairs:
+                postings[term] = ([position for position, _ in pairs], [tf for _, tf in pairs])
+        self.postings = postings
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        n_docs = len(self.ids)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, tfs = self.postings[term]
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for position, tf in zip(docs, tfs):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / self.avg_length)
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key = lambda item: item[1], reverse = True)[:k]
+        return [(self.ids[position], score) for position, score in top]
+
+    def save(self, path: str):
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": {term: [docs, tfs] for term, (docs, tfs) in self.postings.items()}
+        }
+        with gzip.open(path, 'wt', encoding = 'utf-8') as f:
+            json.dump(data, f, separators = (',', ':'))
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with gzip.open(path, 'rt', encoding = 'utf-8') as f:
+            data = json.load(f)
+        postings = {term: (docs, tfs) for term, (docs, tfs) in data["postings"].items()}
+        return cls(data["ids"], data["doc_lengths"], postings, k1 = data["k1"], b = data["b"])
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """Fuse several ranked ID lists; each list contributes 1 / (k + rank) per ID"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key = scores.get, reverse = True)
@@ -0,0 +1,412 @@
+import re
+import sqlite3
+from typing import Optional
+from pydantic import BaseModel, Field
+from langchain_core.documents import Document
+from near_duplicates import MINHASH_KEY, encode_signature, minhash_signature
+
+FISCAL_COLUMNS = (('Enacted', 0), ('Annualized CR', 1), ('Request', 2))
+DEFAULT_OFFICE = 'Department of Energy'
+
+AMOUNT = r"-?[\d,]+|-"
+ROW_PATTERN = re.compile(
+    rf"^(?P<label>.*?[A-Za-z)].*?)\s+(?P<a>{AMOUNT})\s+(?P<b>{AMOUNT})\s+(?P<c>{AMOUNT})"
+    r"\s+(?P<change>[+-]?\$?[\d,]+|-)\s+(?P<percent>[+-]?[\d.]+%|N/A|0|-)\s*$"
+)
+AMOUNT_TOKEN = re.compile(r"^([+-]?\$?[\d,.]+%?|N/A|-)$")
+# A label line ending in one of these words, or followed by a line starting with one or by a single word,
+# continues on the next label line.
+LABEL_JOINERS = ('and', 'of', 'for', 'in', 'the', '&', '-', '–')
+UNIT_PATTERN = re.compile(r"^\s*(\(\$K\)|\(\$M\)|\(Dollars in (Thousands|Millions)\))", re.IGNORECASE)
+TABLE_MAX_CHARS = 600
+HEADER_PATTERN = re.compile(r"^\s*(\(\$K\)|\(\$M\)|\(Dollars in (Thousands|Millions)\)|FY \d{4}|Enacted|Annualized CR|Request|\$ %)", re.IGNORECASE)
+FISCAL_YEAR_PATTERN = re.compile(r"\bFY\s?(\d{4})\b")
+
+# Acronyms used in questions, mapped to the names printed in the tables (as name keys).
+ALIASES = {
+    'nnsa': 'national nuclear security administration',
+    'arpa e': 'advanced research projects agency energy',
+    'eere': 'energy efficiency and renewable energy',
+    'fecm': 'fossil energy and carbon management',
+    'ceser': 'cybersecurity energy security and emergency response',
+    'spr': 'strategic petroleum reserve',
+    'em': 'environmental management',
+    'eia': 'energy information administration',
+    'lpo': 'loan programs office',
+    'oced': 'office of clean energy demonstrations',
+    'scep': 'state and community energy programs',
+    'ehss': 'environment health safety and security'
+}
+
+class BudgetProgram(BaseModel):
+    name: str = Field(..., description = 'Program name')
+    office: str = Field(..., description = 'Office under DOE')
+    funding_request: Optional[float] = Field(None, description='Funding in billions USD')
+    fiscal_year: Optional[int] = Field(None, description = 'Fiscal year of the amount')
+    basis: Optional[str] = Field(None, description = "'Enacted', 'Annualized CR' or 'Request'")
+    source: Optional[str] = Field(None, description = 'Source PDF')
+    page: Optional[int] = Field(None, description = 'Zero-based page number in the source PDF')
+
+def name_key(name: str) -> str:
+    return ' '.join(re.sub(r"[^a-z0-9&]+", ' ', name.lower()).split())
+
+def expand_aliases(question_key: str) -> str:
+    padded = f" {question_key} "
+    for alias, name in ALIASES.items():
+        padded = padded.replace(f" {alias} ", f" {name} ")
+    return padded.strip()
+
+def parse_amount(value: str) -> Optional[int]:
+    return None if value == '-' else int(value.replace(',', ''))
+
+def page_office(lines: list[str]) -> Optional[str]:
+    """Program detail pages open with the office name in capitals above the ($K) marker"""
+    for line in lines[:3]:
+        text = line.strip()
+        if text and text.upper() == text and re.search(r"[A-Z]{3}", text) and '$' not in text:
+            return text.title().replace(' - Nnsa', ' - NNSA').replace(' – Nnsa', ' – NNSA')
+    return None
+
+def is_table_page(text: str) -> bool:
+    return '($K)' in text or 'Dollars in Thousands' in text or '($M)' in text or 'Dollars in Millions' in text
+
+def table_multiplier(text: str) -> int:
+    return 1_000_000 if ('($M)' in text or 'Dollars in Millions' in text) else 1_000
+
+def table_years(text: str) -> list[int]:
+    # Fiscal columns run oldest to newest; the page banner may mention the request year first.
+    years = sorted(set(int(year) for year in FISCAL_YEAR_PATTERN.findall(text[:600])))[:3]
+    return years if len(years) == 3 else [2023, 2024, 2025]
+
+def table_title(lines: list[str]) -> Optional[str]:
+    title = page_office(lines)
+    if title and name_key(title) == name_key(DEFAULT_OFFICE):
+        # Summary tables: let the group headings name the office instead.
+        return None
+    return title
+
+def clean_label(label: str) -> str:
+    # Footnote markers stuck to the label, e.g. "Naval Reactors1".
+    return re.sub(r"(?<=[A-Za-z])\d+$", '', label)
+
+def is_amounts(text: str) -> bool:
+    return all(AMOUNT_TOKEN.match(token) for token in text.split())
+
+def has_detached_amounts(lines: list[str]) -> bool:
+    """Pages that print the labels and the amounts as separate columns, so label lines cannot be paired with amounts"""
+    rows = [len(line.split()) == 5 and is_amounts(line) for line in (line.strip() for line in lines) if line]
+    return any(a and b for a, b in zip(rows, rows[1:]))
+
+def is_label(text: str) -> bool:
+    """Words that could start a wrapped row label, as opposed to a stray amount or percent"""
+    return bool(re.search(r"[A-Za-z]", text)) and not AMOUNT_TOKEN.match(text.split()[-1])
+
+def wraps(label: str, line: str) -> bool:
+    words = line.split()
+    return label.split()[-1] in LABEL_JOINERS or label.endswith(',') or words[0] in LABEL_JOINERS or len(words) == 1
+
+def join_row_line(pending: str, line: str, detached_amounts: bool = False) -> tuple[Optional[re.Match], str, list[str]]:
+    """Feed one stripped table line into the row being assembled from wrapped lines.
+
+    Rows wrap in two ways: the label runs over several lines before the amounts,
+    or the amounts after the first few continue on the following lines, blank
+    lines in between. Returns the completed row match (if any), the text still
+    pending, and the text that turned out not to belong to a row. With
+    `detached_amounts`, amount lines only continue rows that already have amounts.
+    """
+    if not line:
+        if pending and not is_label(pending):
+            return None, pending, []
+        return None, '', [pending] if pending else []
+    if pending and is_label(pending) and is_amounts(line) and detached_amounts:
+        return None, '', [pending, line]
+    if pending and (is_amounts(line) or (is_label(pending) and (not is_label(line) or wraps(pending, line)))):
+        joined = f"{pending} {line}"
+        match = ROW_PATTERN.match(joined)
+        if match:
+            return match, '', []
+        return None, joined, []
+
+    dropped = [pending] if pending else []
+    match = ROW_PATTERN.match(line)
+    if match:
+        return match, '', dropped
+    if len(line) < 80 and not is_amounts(line):
+        # A label, or a row whose remaining amounts are on the next lines.
+        return None, line, dropped
+    return None, '', dropped + [line]
+
+def split_budget_tables(page: Document) -> tuple[list[Document], Document]:
+    """Cut the budget tables out of a page as one chunk per row group, with the column headers repeated.
+
+    Returns the table chunks and the page with the table lines removed, so the
+    surrounding prose can still go through the text splitter. Each chunk's
+    MinHash signature covers its rows only: the repeated title and headers
+    would otherwise make different row groups look like near-duplicates.
+    """
+    text = page.page_content
+    if not is_table_page(text):
+        return [], page
+
+    lines = text.split('\n')
+    years = table_years(text)
+    unit = '($M)' if table_multiplier(text) == 1_000_000 else '($K)'
+    header = (
+        f"{unit} | FY {years[0]} Enacted | FY {years[1]} Annualized CR | FY {years[2]} Request"
+        f" | FY {years[2]} Request vs FY {years[0]} Enacted $ | %"
+    )
+    title = table_title(lines)
+    detached_amounts = has_detached_amounts(lines)
+
+    chunks = []
+    prose = []
+    group = None
+    rows = []
+    pending = ''
+    in_header = False
+
+    def flush():
+        if rows:
+            chunks.append(Document(
+                page_content = '\n'.join([part for part in (title, group, header) if part] + rows),
+                metadata = {
+                    **page.metadata,
+                    'table': True,
+                    'office': title or group or DEFAULT_OFFICE,
+                    MINHASH_KEY: encode_signature(minhash_signature('\n'.join(rows)))
+                }
+            ))
+            rows.clear()
+
+    for line in lines:
+        stripped = line.strip()
+        if UNIT_PATTERN.match(stripped):
+            prose.extend([pending] if pending else [])
+            pending = ''
+            flush()
+            in_header = True
+            continue
+        if stripped and line.endswith('   ') and is_label(stripped):
+            flush()
+            group = f"{pending} {stripped}" if pending and is_label(pending) else stripped
+            prose.extend([pending] if pending and not is_label(pending) else [])
+            pending = ''
+            in_header = False
+            continue
+        if (in_header and (not stripped or is_label(stripped))) or (stripped and HEADER_PATTERN.match(stripped)):
+            if not in_header:
+                prose.append(line)
+            continue
+
+        match, pending, dropped = join_row_line(pending, stripped, detached_amounts)
+        prose.extend(dropped)
+        if not match:
+            if not stripped and not pending:
+                prose.append(line)
+            continue
+        in_header = False
+        row = ' | '.join((
+            clean_label(match.group('label')), match.group('a'), match.group('b'), match.group('c'),
+            match.group('change'), match.group('percent')
+        ))
+        # Long groups continue in another chunk, headers repeated, so each stays inside the embedding window.
+        if rows and sum(len(r) + 1 for r in rows) + len(row) > TABLE_MAX_CHARS:
+            flush()
+        rows.append(row)
+    prose.extend([pending] if pending else [])
+    flush()
+
+    return chunks, Document(page_content = '\n'.join(prose), metadata = dict(page.metadata))
+
+def extract_budget_facts(pages: list[Document]) -> list[BudgetProgram]:
+    """Pull program rows out of the FY comparison tables.
+
+    Each row yields one fact per fiscal column (FY 2023 Enacted, FY 2024
+    Annualized CR, FY 2025 Request). Wrapped labels and amounts are joined
+    (see join_row_line), and rows under an indented group heading take that heading as their office
+    when the page itself has no office title.
+    """
+    facts = []
+    for page in pages:
+        text = page.page_content
+        if not is_table_page(text):
+            continue
+        multiplier = table_multiplier(text)
+        lines = text.split('\n')
+        years = table_years(text)
+        title = table_title(lines)
+        detached_amounts = has_detached_amounts(lines)
+        group = None
+        pending = ''
+        for line in lines:
+            stripped = line.strip()
+            if stripped and HEADER_PATTERN.match(stripped):
+                pending = ''
+                continue
+            if stripped and line.endswith('   ') and is_label(stripped):
+                # Group headings carry the empty table cells as trailing whitespace.
+                group = f"{pending} {stripped}" if pending and is_label(pending) else stripped
+                pending = ''
+                continue
+
+            match, pending, _ = join_row_line(pending, stripped, detached_amounts)
+            if match:
+                label = clean_label(match.group('label'))
+                office = title or group or DEFAULT_OFFICE
+                for (basis, column), year in zip(FISCAL_COLUMNS, years):
+                    amount = parse_amount(match.group('abc'[column]))
+                    if amount is None:
+                        continue
+                    facts.append(BudgetProgram(
+                        name = label,
+                        office = office,
+                        funding_request = amount * multiplier / 1e9,
+                        fiscal_year = year,
+                        basis = basis,
+                        source = page.metadata.get('source'),
+                        page = page.metadata.get('page')
+                    ))
+    return facts
+
+def save_fact_table(facts: list[BudgetProgram], path: str):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("DROP TABLE IF EXISTS budget_facts")
+        conn.execute(
+            "CREATE TABLE budget_facts ("
+            "name TEXT NOT NULL, name_key TEXT NOT NULL, office TEXT NOT NULL, office_key TEXT NOT NULL, "
+            "is_total INTEGER NOT NULL, fiscal_year INTEGER, basis TEXT, amount_billions REAL, "
+            "source TEXT, page INTEGER)"
+        )
+        rows = []
+        for fact in facts:
+            is_total = fact.name.lower().startswith('total,')
+            program = fact.name.split(',', 1)[1].strip() if is_total else fact.name
+            rows.append((
+                fact.name, name_key(program), fact.office, name_key(fact.office), int(is_total),
+                fact.fiscal_year, fact.basis, fact.funding_request, fact.source, fact.page
+            ))
+        conn.executemany("INSERT INTO budget_facts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("CREATE INDEX budget_facts_name ON budget_facts(name_key, fiscal_year, basis)")
+        conn.execute("CREATE INDEX budget_facts_office ON budget_facts(office_key, fiscal_year, basis)")
+        conn.commit()
+    finally:
+        conn.close()
+
+def is_total_label(key: str) -> bool:
+    return key.split(' ', 1)[0] in ('total', 'subtotal')
+
+def longest_first(keys) -> list[str]:
+    return sorted(keys, key = len, reverse = True)
+
+class FactTable:
+    """Read-only lookups against the budget fact table of one index version"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri = True, check_same_thread = False)
+        self._name_offices = {}
+        for name, office in self._conn.execute("SELECT DISTINCT name_key, office_key FROM budget_facts"):
+            self._name_offices.setdefault(name, set()).add(office)
+        offices = {office for keys in self._name_offices.values() for office in keys}
+        # Longest names first so "defense environmental cleanup" wins over "environmental cleanup".
+        # One-word labels ("science", "management", "paducah") and bare totals say too little to match on their own:
+        # one-word names only count next to an office, one-word offices only as "office of <name>".
+        self._names = longest_first(name for name in self._name_offices if ' ' in name and not is_total_label(name))
+        self._context_names = longest_first(name for name in self._name_offices if ' ' not in name and not is_total_label(name))
+        self._office_phrases = {office if ' ' in office else f"office of {office}": office for office in offices}
+        self._offices = longest_first(self._office_phrases)
+
+    @staticmethod
+    def _find(keys: list[str], question_key: str) -> Optional[str]:
+        padded = f" {question_key} "
+        for key in keys:
+            if key and f" {key} " in padded:
+                return key
+        return None
+
+    def _is_ambiguous(self, name: str, filters: str, params: list) -> bool:
+        """Whether the name's rows disagree on the amount for one year and basis, e.g. each office's "Program Direction"."""
+        count, = self._conn.execute(
+            f"SELECT MAX(amounts) FROM (SELECT COUNT(DISTINCT ROUND(amount_billions, 3)) AS amounts FROM budget_facts "
+            f"WHERE name_key = ?{filters} GROUP BY fiscal_year, basis)",
+            [name, *params]
+        ).fetchone()
+        return (count or 0) > 1
+
+    def lookup(self, question: str) -> list[BudgetProgram]:
+        """Facts for the program or office named in the question, or [] when none (or several) match"""
+        question_key = expand_aliases(name_key(question))
+        year_match = FISCAL_YEAR_PATTERN.search(question.upper()) or re.search(r"\b(20\d{2})\b", question)
+        fiscal_year = int(year_match.group(1)) if year_match else None
+        lowered = question.lower()
+        if 'enacted' in lowered:
+            basis = 'Enacted'
+        elif 'annualized' in lowered or re.search(r"\bcr\b", lowered):
+            basis = 'Annualized CR'
+        elif 'request' in lowered or fiscal_year is None:
+            basis = 'Request'
+        else:
+            basis = None
+
+        conditions = []
+        params = []
+        if fiscal_year is not None:
+            conditions.append("fiscal_year = ?")
+            params.append(fiscal_year)
+        if basis is not None:
+            conditions.append("basis = ?")
+            params.append(basis)
+        filters = ''.join(f" AND {condition}" for condition in conditions)
+
+        phrase = self._find(self._offices, question_key)
+        office = self._office_phrases[phrase] if phrase else None
+        # Names are looked for in the rest of the question, so "office of science" does not also match the "science" line.
+        rest = ' '.join(f" {question_key} ".replace(f" {phrase} ", ' ').split()) if phrase else question_key
+        name = self._find(self._names, rest)
+        if name is None and office is not None:
+            name = self._find([key for key in self._context_names if office in self._name_offices[key]], rest)
+        if name is None and office is None:
+            return []
+
+        if name is not None and office in self._name_offices[name]:
+            where, keys = "name_key = ? AND office_key = ?", [name, office]
+        # The more specific (longer) match decides whether this is a program or an office question.
+        elif office is None or (name is not None and len(name) >= len(phrase)):
+            if self._is_ambiguous(name, filters, params):
+                return []
+            where, keys = "name_key = ?", [name]
+        else:
+            where, keys = "office_key = ?", [office]
+        rows = self._conn.execute(
+            f"SELECT name, office, amount_billions, fiscal_year, basis, source, page FROM budget_facts "
+            f"WHERE {where}{filters} ORDER BY is_total DESC, page LIMIT 5",
+            [*keys, *params]
+        ).fetchall()
+
+        return [
+            BudgetProgram(
+                name = name, office = office, funding_request = amount, fiscal_year = year,
+                basis = row_basis, source = source, page = page
+            )
+            for name, office, amount, year, row_basis, source, page in rows
+        ]
+
+    def facts_for_sources(self, sources: list[str]) -> list[BudgetProgram]:
+        """Every stored fact from the given source files, e.g. to carry them into a rebuilt table"""
+        placeholders = ','.join('?' * len(sources))
+        rows = self._conn.execute(
+            f"SELECT name, office, amount_billions, fiscal_year, basis, source, page FROM budget_facts "
+            f"WHERE source IN ({placeholders})",
+            sources
+        ).fetchall()
+        return [
+            BudgetProgram(
+                name = name, office = office, funding_request = amount, fiscal_year = year,
+                basis = basis, source = source, page = page
+            )
+            for name, office, amount, year, basis, source, page in rows
+        ]
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,174 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that persists document vectors in SQLite.
+
+    Vectors are keyed by a hash of the model name and the text, so rebuilds and
+    re-chunking only embed texts that have not been seen before. Once the cache
+    holds more than `max_entries` vectors the least recently used ones are evicted.
+
+    Query vectors are kept in a separate in-process LRU keyed by normalised text,
+    since every retrieval path re-embeds its query string.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, path: str, max_entries: int = 100_000,
+                 query_cache_size: int = 1024):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.query_cache_size = query_cache_size
+        self.query_hits = 0
+        self.query_misses = 0
+        self._queries = OrderedDict()
+        self._query_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread = False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode('utf-8')).hexdigest()
+
+    def _lookup(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay below SQLite's bound-parameter limit.
+        for i in range(0, len(unique_keys), 500):
+            batch = unique_keys[i:i+500]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array('f', blob).tolist()
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found]
+            )
+        return found
+
+    def _store(self, items: list[tuple[str, list[float]]]):
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, array('f', vector).tobytes(), now) for key, vector in items]
+        )
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            cached = self._lookup(keys)
+            self._conn.commit()
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in cached and key not in missing:
+                    missing[key] = text
+            self.hits += sum(1 for key in keys if key in cached)
+            self.misses += len(missing)
+
+        if missing:
+            # The model runs outside the lock so a concurrent upsert can read cached vectors meanwhile.
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = list(zip(missing.keys(), vectors))
+            with self._lock:
+                self._store(new_items)
+                self._conn.commit()
+            cached.update(new_items)
+
+        return [cached[key] for key in keys]
+
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        # all-MiniLM-L6-v2 is uncased and ignores runs of whitespace.
+        return ' '.join(text.split()).lower()
+
+    def _remember_query(self, key: str, vector: list[float]):
+        with self._query_lock:
+            self._queries[key] = vector
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last = False)
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self.normalize_query(text)
+        with self._query_lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self.query_hits += 1
+                return vector
+            self.query_misses += 1
+
+        vector = self.underlying.embed_query(key)
+        self._remember_query(key, vector)
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries, computing all cache misses in one batched model call.
+
+        all-MiniLM-L6-v2 has no query prefix, so document and query vectors match.
+        """
+        keys = [self.normalize_query(text) for text in texts]
+        found = {}
+        with self._query_lock:
+            for key in keys:
+                if key in self._queries and key not in found:
+                    self._queries.move_to_end(key)
+                    found[key] = self._queries[key]
+            self.query_hits += sum(1 for key in keys if key in found)
+            missing = [key for key in dict.fromkeys(keys) if key not in found]
+            self.query_misses += len(missing)
+
+        if missing:
+            for key, vector in zip(missing, self.underlying.embed_documents(missing)):
+                self._remember_query(key, vector)
+                found[key] = vector
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def query_stats(self) -> dict:
+        total = self.query_hits + self.query_misses
+        return {
+            "entries": len(self._queries),
+            "max_entries": self.query_cache_size,
+            "hits": self.query_hits,
+            "misses": self.query_misses,
+            "hit_rate": self.query_hits / total if total else 0.0
+        }
@@ -1,41 +1,506 @@
 import asyncio
+import gzip
+import hashlib
+import json
 import os
-import shutil
 import argparse
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from pypdf import PdfReader, __version__ as PYPDF_VERSION
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain_chroma.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_ollama import ChatOllama
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.runnable import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from typing import Optional
-from pydantic import BaseModel, Field
+from langchain_core.embeddings import Embeddings
+from typing import AsyncIterator, Optional
 from langchain.chains import RetrievalQAWithSourcesChain
+from embedding_cache import CachedEmbeddings
+from page_cache import PageCache
+from pdf_pages import extract_page_range, start_extraction_pool
+from vector_store import VectorStoreManager, SearchRetriever
+from bm25 import BM25Index, reciprocal_rank_fusion
+from budget_facts import BudgetProgram, FactTable, extract_budget_facts, save_fact_table, split_budget_tables
+from answer_cache import SemanticAnswerCache
+from batch_tuning import load_tuned_sizes, save_tuned_size, tune_batch_size
+from near_duplicates import add_minhash_signatures, collapse_near_duplicates
+from token_counter import SPECIAL_TOKENS, TokenCounter, load_tokenizer
 
 DATA = 'dataset/usa-2025-budget-brief-energy-dep-v2.pdf'
+CORPUS = None
+CORPUS_STATUS = 'corpus.json'
 CHROMA = 'chroma'
-embeddings = HuggingFaceEmbeddings(model = 'sentence-transformers/all-MiniLM-L6-v2')
+CHROMA_RETENTION_SECONDS = 3600
+# How often the API server deletes retired versions whose retention has passed.
+CHROMA_GC_INTERVAL_SECONDS = 300
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+# Both backends embed with the same model, but the embedding cache and the index are kept apart
+# (see embedding_model_id) until bench_onnx_embeddings.py shows they agree within ONNX_COSINE_TOLERANCE.
+EMBEDDING_BACKENDS = ('torch', 'onnx')
+EMBEDDING_BACKEND = 'torch'
+# int8 export published with the model; avx2 runs on any x86-64 server (see the onnx/ folder for avx512_vnni and arm64).
+ONNX_MODEL_FILE = 'onnx/model_quint8_avx2.onnx'
+# Target for the largest 1 - cosine between ONNX and torch vectors of the same text; not yet measured (run bench_onnx_embeddings.py).
+ONNX_COSINE_TOLERANCE = 0.02
+EMBEDDING_CACHE = 'embedding_cache.sqlite3'
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000
+QUERY_CACHE_MAX_ENTRIES = 1024
+PAGE_CACHE = 'page_cache.sqlite3'
+# Bump when page extraction changes so cached pages from the old extractor are not reused.
+PAGE_LOADER_VERSION = 2
+# Bump when budget table parsing changes so unchanged files get their table chunks and facts rebuilt.
+TABLE_PARSER_VERSION = 2
+LLM_MODEL = 'llama3.2:3b'
+LLM_CONCURRENCY = 4
+llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+NUMERICAL_KEYWORDS = ['budget', 'million', 'billion', 'dollar', '$', '%', 'funding', 'allocation']
+KEYWORD_NEIGHBOURS = 'keyword_neighbours.json'
+BM25_INDEX = 'bm25.json.gz'
+FACT_TABLE = 'budget_facts.sqlite3'
+CONTEXT_TOKEN_BUDGET = 1500
+CHARS_PER_TOKEN = 4
+MIN_CONTEXT_CHARS = 200
+NEAR_DUPLICATE_THRESHOLD = 0.25
+CHUNKING_MODES = ('overlap', 'parent', 'token', 'table')
+CHUNKING_MODE = 'overlap'
+EMBEDDING_MAX_TOKENS = 256
+TOKEN_CHUNK_OVERLAP = 64
+PARENT_CHUNK_SIZE = 3000
+CHILD_CHUNK_SIZE = 1000
+PARENT_DOCUMENTS = 'parents.json.gz'
+# Chunks per embed/upsert batch; each batch is one call into the embedding cache and one Chroma write.
+INGEST_BATCH_SIZE = 100
+INGEST_QUEUE_PAGES = 16
+INGEST_QUEUE_BATCHES = 2
+BATCH_ORDERS = ('arrival', 'length')
+BATCH_ORDER = 'arrival'
+# In 'length' order the streaming build sorts this many batches' worth of chunks at a time.
+LENGTH_SORT_WINDOW = 8
+# None picks cuda when torch can see a GPU, else cpu.
+EMBEDDING_DEVICE = None
+# Texts per model forward pass; None uses the size saved by --tune-batch-size for this device.
+EMBEDDING_BATCH_SIZE = None
+DEFAULT_EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_BATCH_CANDIDATES = (8, 16, 32, 64, 128)
+EMBEDDING_BATCH_TUNING = 'embedding_batch_size.json'
+RETRIEVAL_MODES = ('dense', 'lexical', 'hybrid')
+RETRIEVAL_MODE = 'dense'
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_MAX_ENTRIES = 256
 
-class BudgetProgram(BaseModel):
-    name: str = Field(..., description = 'Program name')
-    office: str = Field(..., description = 'Office under DOE')
-    funding_request: Optional[float] = Field(None, description='Funding in billions USD')
+class LazyEmbeddings(Embeddings):
+    """Defers loading the embedding backend (torch or onnxruntime) and the model until the first embedding call"""
 
-async def load_data():
-    if not os.path.exists(DATA):
-        raise FileNotFoundError(f"PDF file not found: {DATA}")
+    def __init__(self, factory):
+        self.factory = factory
+        self._model = None
+        self._lock = threading.Lock()
 
-    loader = PyPDFLoader(DATA)
-    pages = []
-    async for page in loader.alazy_load():
-        pages.append(page)
-    return pages
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
 
+    def load(self) -> Embeddings:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self.factory()
+        return self._model
 
-def text_splitter(docs: list[Document]):
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.load().embed_query(text)
+
+def embedding_device() -> str:
+    if EMBEDDING_BACKEND == 'onnx':
+        return 'cpu'
+    if EMBEDDING_DEVICE:
+        return EMBEDDING_DEVICE
+    import torch
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+def device_profile(device: str) -> str:
+    """Key for tuned batch sizes, which depend on the backend and the GPU model or the number of cores"""
+    if device.startswith('cuda'):
+        import torch
+        return f"{EMBEDDING_BACKEND} {device} {torch.cuda.get_device_name(device)}"
+    return f"{EMBEDDING_BACKEND} {device} x{os.cpu_count()}"
+
+def embedding_batch_size(device: str) -> int:
+    """EMBEDDING_BATCH_SIZE, else the tuned size for this model and device, else the default"""
+    if EMBEDDING_BATCH_SIZE:
+        return EMBEDDING_BATCH_SIZE
+    tuned = load_tuned_sizes(EMBEDDING_BATCH_TUNING).get(EMBEDDING_MODEL, {}).get(device_profile(device))
+    return tuned["batch_size"] if tuned else DEFAULT_EMBEDDING_BATCH_SIZE
+
+def load_onnx_embedding_model():
+    from huggingface_hub import hf_hub_download
+    from onnx_embeddings import OnnxEmbeddings
+    # A local path (e.g. a model quantized for this machine) is used as is.
+    path = ONNX_MODEL_FILE if os.path.exists(ONNX_MODEL_FILE) else hf_hub_download(EMBEDDING_MODEL, ONNX_MODEL_FILE)
+    return OnnxEmbeddings(
+            path,
+            load_tokenizer(EMBEDDING_MODEL),
+            max_tokens = EMBEDDING_MAX_TOKENS,
+            batch_size = embedding_batch_size('cpu')
+    )
+
+def load_embedding_model():
+    if EMBEDDING_BACKEND == 'onnx':
+        return load_onnx_embedding_model()
+    from langchain_huggingface import HuggingFaceEmbeddings
+    device = embedding_device()
+    return HuggingFaceEmbeddings(
+            model = EMBEDDING_MODEL,
+            model_kwargs = {'device': device},
+            encode_kwargs = {'batch_size': embedding_batch_size(device)}
+    )
+
+def embedding_model_id() -> str:
+    """Which model and backend produced a vector; cached vectors and indexes are only reused under the same ID"""
+    # torch keeps the bare model name, so caches and indexes built before the ONNX backend stay valid.
+    return EMBEDDING_MODEL if EMBEDDING_BACKEND == 'torch' else f"{EMBEDDING_MODEL}/{ONNX_MODEL_FILE}"
+
+embedding_model = LazyEmbeddings(load_embedding_model)
+token_counter = TokenCounter(EMBEDDING_MODEL)
+embeddings = CachedEmbeddings(
+        embedding_model,
+        model_name = embedding_model_id(),
+        path = EMBEDDING_CACHE,
+        max_entries = EMBEDDING_CACHE_MAX_ENTRIES,
+        query_cache_size = QUERY_CACHE_MAX_ENTRIES
+)
+vector_store = VectorStoreManager(CHROMA, embeddings, retention_seconds = CHROMA_RETENTION_SECONDS)
+page_cache = PageCache(PAGE_CACHE)
+answer_cache = SemanticAnswerCache(
+        threshold = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds = ANSWER_CACHE_TTL_SECONDS,
+        max_entries = ANSWER_CACHE_MAX_ENTRIES
+)
+
+class BuildProgress:
+    """Progress of a database build, updated by build_database as it moves through its stages.
+
+    Stages: load (find and hash the files), ingest (pages stream through split,
+    embed and upsert, all running at once), commit (side indexes and the
+    version swap), then completed or failed. While ingesting, the page and chunk
+    counters show how far each part of the pipeline has got.
+    """
+
+    STAGES = ('pending', 'load', 'ingest', 'commit', 'completed', 'failed')
+
+    def __init__(self):
+        self.stage = 'pending'
+        self.pages_total = None
+        self.pages_loaded = 0
+        self.pages_split = 0
+        self.split_done = False
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.chunks_done = 0
+        self.error = None
+        self.files = {}
+        self.started_at = time.time()
+        self.finished_at = None
+        self._ingest_started_at = None
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        if stage == 'ingest' and self._ingest_started_at is None:
+            self._ingest_started_at = time.time()
+
+    def advance(self, chunks: int):
+        self.chunks_done += chunks
+
+    def expected_chunks(self) -> Optional[float]:
+        """Chunks to embed: exact once every page is split, before that extrapolated from the pages split so far"""
+        if self.split_done:
+            return self.chunks_total
+        if self.pages_total and self.pages_split:
+            return self.chunks_total * self.pages_total / self.pages_split
+        return None
+
+    def finish(self, error: Optional[str] = None):
+        self.error = error
+        self.stage = 'failed' if error else 'completed'
+        self.finished_at = time.time()
+
+    def snapshot(self) -> dict:
+        now = self.finished_at or time.time()
+        throughput = None
+        eta = None
+        expected = self.expected_chunks()
+        if self._ingest_started_at is not None and self.chunks_done:
+            throughput = self.chunks_done / max(now - self._ingest_started_at, 1e-9)
+            if expected is not None:
+                eta = max(expected - self.chunks_done, 0) / throughput
+        return {
+            "stage": self.stage,
+            "pages_total": self.pages_total,
+            "pages_loaded": self.pages_loaded,
+            "pages_split": self.pages_split,
+            "chunks_total": self.chunks_total,
+            "chunks_total_final": self.split_done,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_done": self.chunks_done,
+            "chunks_per_sec": throughput,
+            "eta_seconds": 0.0 if self.finished_at is not None else eta,
+            "elapsed_seconds": now - self.started_at,
+            "files": {path: dict(entry) for path, entry in self.files.items()},
+            "error": self.error
+        }
+
+def embed_queries(queries: list[str]) -> list[list[float]]:
+    """Embed several queries in one batched model call and keep them in the query cache"""
+    return embeddings.embed_queries(queries)
+
+def similarity_search(db, query_text: str, k: int, query_vector: Optional[list[float]] = None) -> list[Document]:
+    if query_vector is None:
+        return db.similarity_search(query_text, k = k)
+    return db.similarity_search_by_vector(query_vector, k = k)
+
+_index_artifacts = {}
+
+def load_index_artifact(name: str, loader):
+    """Load a file stored next to the live index, once per index version. None if it is missing."""
+    version = vector_store.current_version()
+    cached = _index_artifacts.get(name)
+    if cached is None or cached[0] != version:
+        path = os.path.join(vector_store.current_path(), name)
+        cached = (version, loader(path) if os.path.exists(path) else None)
+        _index_artifacts[name] = cached
+    return cached[1]
+
+def retrieve(db, query_text: str, k: int, query_vector: Optional[list[float]] = None,
+             mode: Optional[str] = None) -> list[Document]:
+    """Dense, BM25 or hybrid (reciprocal rank fusion of both) retrieval.
+
+    On parent/child indexes the k child hits are returned as their (at most k) parent sections.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}. Expected one of {', '.join(RETRIEVAL_MODES)}")
+
+    index = load_index_artifact(BM25_INDEX, BM25Index.load) if mode != 'dense' else None
+    if index is None:
+        return expand_to_parents(similarity_search(db, query_text, k, query_vector))
+
+    lexical_ids = [doc_id for doc_id, _ in index.search(query_text, k = k * 2)]
+    if mode == 'lexical':
+        dense_docs = []
+        ranked_ids = lexical_ids[:k]
+    else:
+        dense_docs = similarity_search(db, query_text, k * 2, query_vector)
+        ranked_ids = reciprocal_rank_fusion([[doc.id for doc in dense_docs], lexical_ids])[:k]
+
+    docs_by_id = {doc.id: doc for doc in dense_docs}
+    missing_ids = [doc_id for doc_id in ranked_ids if doc_id not in docs_by_id]
+    if missing_ids:
+        docs_by_id.update({doc.id: doc for doc in db.get_by_ids(missing_ids)})
+    return expand_to_parents([docs_by_id[doc_id] for doc_id in ranked_ids if doc_id in docs_by_id])
+
+def load_parent_documents(path: str) -> dict[str, Document]:
+    with gzip.open(path, 'rt', encoding = 'utf-8') as f:
+        parents = json.load(f)
+    return {
+        parent_id: Document(id = parent_id, page_content = parent["page_content"], metadata = parent["metadata"])
+        for parent_id, parent in parents.items()
+    }
+
+def expand_to_parents(docs: list[Document]) -> list[Document]:
+    """Swap child chunks for their parent sections, keeping the rank of each parent's best child.
+
+    A no-op for indexes built with the overlapping splitter.
+    """
+    parents = load_index_artifact(PARENT_DOCUMENTS, load_parent_documents)
+    if parents is None:
+        return docs
+
+    expanded = []
+    seen = set()
+    for doc in docs:
+        parent_id = doc.metadata.get('parent_id')
+        if parent_id not in parents:
+            expanded.append(doc)
+        elif parent_id not in seen:
+            seen.add(parent_id)
+            expanded.append(parents[parent_id])
+    return expanded
+
+def get_llm():
+    return ChatOllama(model = LLM_MODEL, temperature = 0.1)
+
+def discover_corpus(path: str) -> list[str]:
+    """PDFs to index: every PDF under a directory, the files listed in a manifest, or a single PDF.
+
+    A manifest is a JSON list of paths or a text file with one path per line,
+    relative to the manifest's directory.
+    """
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if name.lower().endswith('.pdf')
+        )
+    if path.lower().endswith('.pdf'):
+        return [path]
+
+    with open(path) as f:
+        entries = json.load(f) if path.lower().endswith('.json') else [line.strip() for line in f]
+    base = os.path.dirname(path)
+    return [os.path.join(base, entry) for entry in entries if entry and not entry.startswith('#')]
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def page_count(path: str) -> Optional[int]:
+    """Number of pages, read from the page tree without extracting any text"""
+    try:
+        return len(PdfReader(path).pages)
+    except Exception:
+        return None
+
+def record_file(files: Optional[dict], path: str, **fields):
+    if files is not None:
+        files.setdefault(path, {}).update(fields)
+
+def page_loader_id() -> str:
+    """Cache key part naming the extractor; PyPDFLoader and extract_page_range() produce the same pages"""
+    return f"pypdf-{PYPDF_VERSION}/v{PAGE_LOADER_VERSION}"
+
+async def iter_pages_parallel(paths: list[str], workers: int, status: Optional[dict] = None,
+                              cache: Optional[PageCache] = None, hashes: Optional[dict] = None) -> AsyncIterator[Document]:
+    """Split the page ranges of all files across a process pool and yield pages in file and page order.
+
+    At most two slices per worker are in flight, so a slow consumer holds back
+    extraction. A file that fails to open or parse is marked failed in `status`
+    and the rest of the corpus carries on. With a cache, each extracted page is
+    stored under its file hash.
+    """
+    def count_pages() -> dict[str, int]:
+        counts = {}
+        for path in paths:
+            try:
+                counts[path] = len(PdfReader(path).pages)
+            except Exception as e:
+                record_file(status, path, status = 'failed', error = str(e))
+        return counts
+
+    # Opening dozens of PDFs (and waiting for the pool to shut down) must not stall the server's event loop.
+    page_counts = await asyncio.to_thread(count_pages)
+    # A few slices per worker keeps the pool busy when page costs are uneven.
+    slice_size = max(1, -(-sum(page_counts.values()) // (workers * 4)))
+    ranges = [
+        (path, start, min(start + slice_size, total_pages))
+        for path, total_pages in page_counts.items()
+        for start in range(0, total_pages, slice_size)
+    ]
+
+    loop = asyncio.get_running_loop()
+    loader = page_loader_id()
+    remaining = Counter(path for path, _, _ in ranges)
+    failed = set()
+
+    async def collect(path, future):
+        try:
+            pages = await future
+        except Exception as e:
+            failed.add(path)
+            record_file(status, path, status = 'failed', error = str(e))
+            return []
+        if path in failed:
+            return []
+        remaining[path] -= 1
+        if cache is not None:
+            for page in pages:
+                cache.put_page(hashes[path], loader, page.metadata['page'], page)
+            if remaining[path] == 0:
+                cache.complete_file(hashes[path], loader, page_counts[path])
+        record_file(status, path, status = 'indexed', pages = page_counts[path])
+        return pages
+
+    pool = await asyncio.to_thread(start_extraction_pool, workers)
+    try:
+        in_flight = deque()
+        for path, start, stop in ranges:
+            in_flight.append((path, loop.run_in_executor(pool, extract_page_range, path, start, stop)))
+            if len(in_flight) >= workers * 2:
+                for page in await collect(*in_flight.popleft()):
+                    yield page
+        while in_flight:
+            for page in await collect(*in_flight.popleft()):
+                yield page
+    finally:
+        await asyncio.to_thread(pool.shutdown, cancel_futures = True)
+
+async def iter_pages(workers: int = 1, paths: Optional[list[str]] = None, status: Optional[dict] = None,
+                     use_cache: bool = True, hashes: Optional[dict] = None) -> AsyncIterator[Document]:
+    """Yield the pages of every PDF in `paths` (default: DATA), recording per-file outcomes in `status`.
+
+    Files whose hash is in the page cache are served from it without parsing;
+    the rest are extracted and cached. `hashes` saves re-hashing files the caller already hashed.
+    """
+    paths = [DATA] if paths is None else paths
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"PDF file not found: {path}")
+
+    cache = page_cache if use_cache else None
+    loader = page_loader_id()
+    hashes = dict(hashes or {})
+    to_extract = paths
+    if cache is not None:
+        await asyncio.to_thread(cache.prune, loader)
+        to_extract = []
+        for path in paths:
+            if path not in hashes:
+                hashes[path] = await asyncio.to_thread(file_sha256, path)
+            cached = await asyncio.to_thread(cache.get_file, hashes[path], loader)
+            if cached is None:
+                to_extract.append(path)
+                continue
+            for page in cached:
+                # The same content may have been cached under another path.
+                page.metadata['source'] = path
+                yield page
+            record_file(status, path, status = 'indexed', pages = len(cached))
+
+    if workers > 1:
+        async for page in iter_pages_parallel(to_extract, workers, status, cache, hashes):
+            yield page
+        return
+
+    for path in to_extract:
+        pages = 0
+        try:
+            async for page in PyPDFLoader(path).alazy_load():
+                if cache is not None:
+                    cache.put_page(hashes[path], loader, page.metadata.get('page', pages), page)
+                pages += 1
+                yield page
+        except Exception as e:
+            record_file(status, path, status = 'failed', error = str(e))
+            continue
+        if cache is not None:
+            cache.complete_file(hashes[path], loader, pages)
+        record_file(status, path, status = 'indexed', pages = pages)
+
+async def load_data(workers: int = 1, use_cache: bool = True):
+    return [page async for page in iter_pages(workers, use_cache = use_cache)]
+
+
+def text_splitter(docs: list[Document], verbose: bool = True):
     if not docs:
         raise ValueError("No documents are provided for splitting.")
 
@@ -48,60 +513,502 @@ def text_splitter(docs: list[Document]):
     )
 
     chunks = text_splitter.split_documents(docs)
-    print(f"Split {len(docs)} documents into {len(chunks)} chunks.")
-    if len(chunks) > 10:
-        document = chunks[10]
-        print("\nSample chunk (10):")
-        print(f"Content Review: {document.page_content[:200]}...")
-        print(f"Metadata Review: {document.metadata}")
-    else:
-        print("Not enough chunks to print chunk 10.")
+    if verbose:
+        print(f"Split {len(docs)} documents into {len(chunks)} chunks.")
+        if len(chunks) > 10:
+            document = chunks[10]
+            print("\nSample chunk (10):")
+            print(f"Content Review: {document.page_content[:200]}...")
+            print(f"Metadata Review: {document.metadata}")
+        else:
+            print("Not enough chunks to print chunk 10.")
+
+    # Signatures ride along as chunk metadata so retrieval can collapse overlapping neighbours.
+    return add_minhash_signatures(chunks)
+
+def token_splitter(docs: list[Document], verbose: bool = True):
+    """Split with lengths measured in embedding-model word pieces, so every chunk fits the model window"""
+    if not docs:
+        raise ValueError("No documents are provided for splitting.")
+
+    separators = ["\n\n", "\n", " ", ""]
+    text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size = EMBEDDING_MAX_TOKENS - SPECIAL_TOKENS,
+            chunk_overlap = TOKEN_CHUNK_OVERLAP,
+            length_function = token_counter.count,
+            separators = separators,
+            keep_separator = False,
+            is_separator_regex = False,
+            add_start_index = True
+    )
+
+    # The splitter measures each first-level piece one by one; count them all in one batch up front.
+    pieces = []
+    for doc in docs:
+        separator = next((sep for sep in separators[:-1] if sep in doc.page_content), None)
+        if separator:
+            pieces.extend(piece for piece in doc.page_content.split(separator) if piece)
+    token_counter.count_many(pieces)
+
+    chunks = text_splitter.split_documents(docs)
+    if verbose:
+        print(f"Split {len(docs)} documents into {len(chunks)} chunks of at most "
+              f"{EMBEDDING_MAX_TOKENS - SPECIAL_TOKENS} tokens. Token counts: {token_counter.stats()}")
+    return add_minhash_signatures(chunks)
+
+def table_splitter(docs: list[Document], verbose: bool = True):
+    """One chunk per budget table row group (column headers repeated); the remaining prose is split as usual"""
+    if not docs:
+        raise ValueError("No documents are provided for splitting.")
+
+    table_chunks = []
+    prose_pages = []
+    table_pages = 0
+    for doc in docs:
+        tables, prose = split_budget_tables(doc)
+        table_chunks.extend(tables)
+        prose_pages.append(prose)
+        table_pages += bool(tables)
+
+    if verbose:
+        print(f"Cut {len(table_chunks)} table row groups out of {table_pages} pages.")
+    # Table chunks are already signed over their rows by split_budget_tables().
+    return table_chunks + text_splitter(prose_pages, verbose)
+
+def split_pages(pages: list[Document], chunking: Optional[str] = None,
+                verbose: bool = True) -> tuple[list[Document], Optional[list[Document]]]:
+    """Chunk pages with the given chunking mode; returns the chunks to index and, in parent mode, their parents"""
+    chunking = chunking or CHUNKING_MODE
+    if chunking not in CHUNKING_MODES:
+        raise ValueError(f"Unknown chunking mode: {chunking}. Expected one of {', '.join(CHUNKING_MODES)}")
+    if chunking == 'parent':
+        return parent_child_splitter(pages, verbose)
+    if chunking == 'token':
+        return token_splitter(pages, verbose), None
+    if chunking == 'table':
+        return table_splitter(pages, verbose), None
+    return text_splitter(pages, verbose), None
 
-    return chunks
+def parent_child_splitter(docs: list[Document], verbose: bool = True) -> tuple[list[Document], list[Document]]:
+    """Split pages into non-overlapping parent sections, and each section into non-overlapping children.
 
-def save_at_chroma(chunks: list[Document]):
+    Only the children are embedded and indexed; retrieval returns their parent for context.
+    """
+    if not docs:
+        raise ValueError("No documents are provided for splitting.")
+
+    parent_splitter = RecursiveCharacterTextSplitter(
+            chunk_size = PARENT_CHUNK_SIZE,
+            chunk_overlap = 0,
+            length_function = len,
+            is_separator_regex = False,
+            add_start_index = True
+    )
+    child_splitter = RecursiveCharacterTextSplitter(
+            chunk_size = CHILD_CHUNK_SIZE,
+            chunk_overlap = 0,
+            length_function = len,
+            is_separator_regex = False,
+            add_start_index = True
+    )
+
+    parents = add_minhash_signatures(parent_splitter.split_documents(docs))
+    children = []
+    for parent in parents:
+        parent.id = chunk_id(parent)
+        for child in child_splitter.split_documents([parent]):
+            # Child offsets are relative to the parent; make them page offsets again.
+            child.metadata['start_index'] += parent.metadata['start_index']
+            child.metadata['parent_id'] = parent.id
+            children.append(child)
+
+    if verbose:
+        print(f"Split {len(docs)} documents into {len(parents)} parent sections and {len(children)} child chunks.")
+    return add_minhash_signatures(children), parents
+
+def plan_batches(items: list[tuple[str, Document]], batch_size: int, order: str) -> list[list[tuple[str, Document]]]:
+    """Cut (ID, chunk) pairs into batches.
+
+    'length' sorts by text length first, so each batch reaches the model with
+    chunks of similar size and short ones are not padded to a long neighbour.
+    Chunk order does not matter to the index, since IDs are content hashes.
+    """
+    if order == 'length':
+        items = sorted(items, key = lambda item: len(item[1].page_content))
+    return [items[i:i+batch_size] for i in range(0, len(items), batch_size)]
+
+def chunk_id(chunk: Document) -> str:
+    """Stable ID derived from the chunk's source, page and text"""
+    key = f"{chunk.metadata.get('source', '')}\x00{chunk.metadata.get('page', '')}\x00{chunk.page_content}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+class IndexWriter:
+    """A staged index version that is filled batch by batch and then published in one step.
+
+    Writes go into a fresh copy of the current version, so searches keep using
+    the live index until commit(). Chunks already in the index (same ID) are kept
+    without re-embedding, with their metadata rewritten if the split gave them
+    new metadata, and anything the new chunks no longer contain is
+    deleted on commit. The BM25 index and parent sections are built as chunks
+    arrive, so nothing here needs the whole corpus in memory at once.
+    """
+
+    def __init__(self, progress: Optional[BuildProgress] = None):
+        self.progress = progress
+        # Vectors from another embedding backend cannot be mixed with new ones, so the version starts empty.
+        previous = read_corpus_status().get("chunking", {})
+        seed = previous.get("embedding", EMBEDDING_MODEL) == embedding_model_id()
+        self.version, self.path = vector_store.stage_version(seed = seed)
+        self.db = vector_store.open_version(self.path)
+        existing = self.db.get(include = ['metadatas'])
+        self.existing_metadata = dict(zip(existing['ids'], existing['metadatas']))
+        self.existing_ids = set(self.existing_metadata)
+        self.seen_ids = set()
+        self.embedded = 0
+        self.refreshed = []
+        self.bm25 = BM25Index([], [], {})
+        self.source_chunks = Counter()
+        self.source_ids = defaultdict(set)
+        self._parent_file = None
+        self._parent_ids = set()
+
+    def select_new(self, chunks: list[Document]) -> list[tuple[str, Document]]:
+        """Register chunks for this version and return the (ID, chunk) pairs that still need embedding"""
+        new = []
+        for chunk in chunks:
+            cid = chunk_id(chunk)
+            # Identical chunks on the same page collapse to one ID.
+            if cid in self.seen_ids:
+                continue
+            self.seen_ids.add(cid)
+            self.bm25.add(cid, chunk.page_content)
+            self.source_chunks[chunk.metadata.get('source')] += 1
+            self.source_ids[chunk.metadata.get('source')].add(cid)
+            if cid not in self.existing_ids:
+                new.append((cid, chunk))
+            elif self.existing_metadata[cid] != chunk.metadata:
+                # Same text, new metadata (parent_id, minhash, start_index after an edit above it): rewrite it.
+                self.refreshed.append((cid, chunk.metadata))
+        if self.progress:
+            self.progress.chunks_total += len(new)
+        return new
+
+    def drop_sources(self, sources: list[str]):
+        """Forget the chunks already written for files that failed partway, before keep_sources() restores them"""
+        ids = set()
+        for source in sources:
+            ids |= self.source_ids.pop(source, set())
+            self.source_chunks.pop(source, None)
+        if not ids:
+            return
+        self.seen_ids -= ids
+        self.bm25.remove(ids)
+        self.refreshed = [(cid, metadata) for cid, metadata in self.refreshed if cid not in ids]
+        added = [cid for cid in ids if cid not in self.existing_ids]
+        for i in range(0, len(added), INGEST_BATCH_SIZE):
+            self.db.delete(ids = added[i:i+INGEST_BATCH_SIZE])
+        self.embedded -= len(added)
+
+    def keep_sources(self, sources: list[str]) -> list[BudgetProgram]:
+        """Carry the chunks, parent sections and budget facts of unchanged files over from the previous version"""
+        if not sources:
+            return []
+        sources = set(sources)
+        for source in sources:
+            kept = self.db.get(where = {"source": source}, include = ['documents'])
+            for cid, text in zip(kept['ids'], kept['documents']):
+                if cid not in self.seen_ids:
+                    self.seen_ids.add(cid)
+                    self.bm25.add(cid, text)
+                    self.source_chunks[source] += 1
+
+        parent_path = os.path.join(self.path, PARENT_DOCUMENTS)
+        if os.path.exists(parent_path):
+            self.add_parents([
+                parent for parent in load_parent_documents(parent_path).values()
+                if parent.metadata.get('source') in sources
+            ])
+
+        fact_path = os.path.join(self.path, FACT_TABLE)
+        if not os.path.exists(fact_path):
+            return []
+        fact_table = FactTable(fact_path)
+        try:
+            return fact_table.facts_for_sources(sorted(sources))
+        finally:
+            fact_table.close()
+
+    def add_parents(self, parents: list[Document]):
+        """Append parent sections to the version's parents.json.gz as they are produced"""
+        if self._parent_file is None:
+            # Written next to the copied file, which keep_sources() may still need to read.
+            self._parent_file = gzip.open(os.path.join(self.path, f"{PARENT_DOCUMENTS}.tmp"), 'wt', encoding = 'utf-8')
+            self._parent_file.write('{')
+        for parent in parents:
+            if parent.id in self._parent_ids:
+                continue
+            separator = ',' if self._parent_ids else ''
+            self._parent_ids.add(parent.id)
+            record = json.dumps({"page_content": parent.page_content, "metadata": parent.metadata})
+            self._parent_file.write(f"{separator}{json.dumps(parent.id)}:{record}")
+
+    def embed(self, batch: list[tuple[str, Document]]) -> list[list[float]]:
+        vectors = embeddings.embed_documents([chunk.page_content for _, chunk in batch])
+        if self.progress:
+            self.progress.chunks_embedded += len(batch)
+        return vectors
+
+    def upsert(self, batch: list[tuple[str, Document]], vectors: list[list[float]]):
+        # Written with the vectors from embed(); add_documents would look every text up in the cache a second time.
+        self.db._collection.upsert(
+                ids = [cid for cid, _ in batch],
+                embeddings = vectors,
+                documents = [chunk.page_content for _, chunk in batch],
+                metadatas = [chunk.metadata for _, chunk in batch]
+        )
+        self.embedded += len(batch)
+        if self.progress:
+            self.progress.advance(len(batch))
+
+    def commit(self, facts: Optional[list[BudgetProgram]] = None, corpus: Optional[dict] = None):
+        """Delete stale chunks, write the side indexes and publish the version"""
+        if not self.seen_ids:
+            raise ValueError("No chunks provided for saving at Chroma")
+        if self.progress:
+            self.progress.set_stage('commit')
+
+        for i in range(0, len(self.refreshed), INGEST_BATCH_SIZE):
+            batch = self.refreshed[i:i+INGEST_BATCH_SIZE]
+            # Chroma merges metadata on update; None removes the keys the new chunk no longer has.
+            self.db._collection.update(
+                    ids = [cid for cid, _ in batch],
+                    metadatas = [
+                        {**{key: None for key in self.existing_metadata[cid] if key not in metadata}, **metadata}
+                        for cid, metadata in batch
+                    ]
+            )
+
+        stale_ids = [cid for cid in self.existing_ids if cid not in self.seen_ids]
+        for i in range(0, len(stale_ids), INGEST_BATCH_SIZE):
+            self.db.delete(ids = stale_ids[i:i+INGEST_BATCH_SIZE])
+        if stale_ids:
+            print(f"Deleted {len(stale_ids)} stale chunks.")
+
+        save_keyword_neighbours(self.db, self.path)
+        self.bm25.save(os.path.join(self.path, BM25_INDEX))
+        parent_path = os.path.join(self.path, PARENT_DOCUMENTS)
+        if self._parent_file is not None:
+            self._parent_file.write('}')
+            self._parent_file.close()
+            self._parent_file = None
+            os.replace(f"{parent_path}.tmp", parent_path)
+        elif os.path.exists(parent_path):
+            # Copied from the previous version; it no longer matches these chunks.
+            os.remove(parent_path)
+        fact_path = os.path.join(self.path, FACT_TABLE)
+        if facts is not None:
+            save_fact_table(facts, fact_path)
+        elif os.path.exists(fact_path):
+            os.remove(fact_path)
+        corpus_path = os.path.join(self.path, CORPUS_STATUS)
+        if corpus is not None:
+            for source, entry in corpus["files"].items():
+                entry["chunks"] = self.source_chunks.get(source, 0)
+            with open(corpus_path, 'w') as f:
+                json.dump(corpus, f, indent = 2)
+        elif os.path.exists(corpus_path):
+            os.remove(corpus_path)
+
+        vector_store.release(self.db)
+        vector_store.publish(self.version, self.path)
+        print(f"Successfully saved {len(self.seen_ids)} chunks at {self.path} "
+              f"({self.embedded} embedded, {len(self.seen_ids) - self.embedded} unchanged, "
+              f"{len(self.refreshed)} with refreshed metadata, {len(stale_ids)} deleted)")
+        print(f"Embedding cache: {embeddings.stats()}")
+
+    def discard(self):
+        if self._parent_file is not None:
+            self._parent_file.close()
+            self._parent_file = None
+        vector_store.release(self.db)
+        vector_store.discard(self.path)
+
+def save_at_chroma(chunks: list[Document], progress: Optional[BuildProgress] = None,
+                   facts: Optional[list[BudgetProgram]] = None, parents: Optional[list[Document]] = None,
+                   batch_size: Optional[int] = None, batch_order: Optional[str] = None):
     if not chunks:
         raise ValueError("No chunks provided for saving at Chroma")
 
-    if os.path.exists(CHROMA):
-        shutil.rmtree(CHROMA)
+    writer = IndexWriter(progress)
+    try:
+        if parents is not None:
+            writer.add_parents(parents)
+        new = writer.select_new(chunks)
+        if progress:
+            progress.set_stage('ingest')
+            progress.split_done = True
+        for number, batch in enumerate(plan_batches(new, batch_size or INGEST_BATCH_SIZE, batch_order or BATCH_ORDER), 1):
+            writer.upsert(batch, writer.embed(batch))
+            print(f"Added batch: {number}: {len(batch)} chunks.")
+        writer.commit(facts)
+    except Exception:
+        writer.discard()
+        raise
+
+async def ingest(pages: AsyncIterator[Document], chunking: Optional[str] = None,
+                 progress: Optional[BuildProgress] = None, unchanged: Optional[list[str]] = None,
+                 corpus: Optional[dict] = None, batch_size: Optional[int] = None, batch_order: Optional[str] = None):
+    """Stream pages through split -> embed -> upsert, with every stage running concurrently.
 
-    db = Chroma(
-            embedding_function = embeddings,
-            persist_directory = CHROMA
-    )
+    The stages are connected by bounded queues, so a slow stage stalls the ones
+    before it instead of letting pages or chunks pile up: memory stays at a few
+    pages and batches however large the corpus is.
 
-    batch_size = 100
-    for i in range(0,len(chunks), batch_size):
-        batch = chunks[i:i+batch_size]
-        db.add_documents(batch)
-        print(f"Added batch: {i//batch_size + 1}: {len(batch)} chunks.")
+    Files listed in `unchanged` are not re-read; their chunks are carried over
+    from the current version. `corpus` ({"chunking": ..., "files": {path: entry}})
+    is filled in by the page source and saved with the version.
 
-    print(f"Successfully saved {len(chunks)} chunks at {CHROMA}")
+    In 'length' batch order, chunks are sorted within a window of
+    LENGTH_SORT_WINDOW batches, which keeps memory bounded while streaming.
+    """
+    batch_size = batch_size or INGEST_BATCH_SIZE
+    batch_order = batch_order or BATCH_ORDER
+    window = batch_size * (LENGTH_SORT_WINDOW if batch_order == 'length' else 1)
+    writer = await asyncio.to_thread(IndexWriter, progress)
+    page_queue = asyncio.Queue(maxsize = INGEST_QUEUE_PAGES)
+    embed_queue = asyncio.Queue(maxsize = INGEST_QUEUE_BATCHES)
+    upsert_queue = asyncio.Queue(maxsize = INGEST_QUEUE_BATCHES)
+    facts = []
 
-def ask_numerical_questions(query_text):
+    def split_page(page: Document):
+        chunks, parents = split_pages([page], chunking, verbose = False)
+        if parents is not None:
+            writer.add_parents(parents)
+        facts.extend(extract_budget_facts([page]))
+        return writer.select_new(chunks)
+
+    async def load():
+        async for page in pages:
+            await page_queue.put(page)
+            if progress:
+                progress.pages_loaded += 1
+        await page_queue.put(None)
+
+    async def split():
+        pending = []
+        while (page := await page_queue.get()) is not None:
+            pending.extend(await asyncio.to_thread(split_page, page))
+            if progress:
+                progress.pages_split += 1
+            if len(pending) >= window:
+                batches = plan_batches(pending, batch_size, batch_order)
+                # A short last batch waits for the next pages to fill it.
+                pending = batches.pop() if len(batches[-1]) < batch_size else []
+                for batch in batches:
+                    await embed_queue.put(batch)
+        if progress:
+            progress.split_done = True
+        for batch in plan_batches(pending, batch_size, batch_order):
+            await embed_queue.put(batch)
+        await embed_queue.put(None)
+
+    async def embed():
+        while (batch := await embed_queue.get()) is not None:
+            vectors = await asyncio.to_thread(writer.embed, batch)
+            await upsert_queue.put((batch, vectors))
+        await upsert_queue.put(None)
+
+    async def upsert():
+        batches = 0
+        while (item := await upsert_queue.get()) is not None:
+            batch, vectors = item
+            await asyncio.to_thread(writer.upsert, batch, vectors)
+            batches += 1
+            print(f"Added batch: {batches}: {len(batch)} chunks.")
+
+    tasks = []
+    if progress:
+        progress.set_stage('ingest')
+    try:
+        if unchanged:
+            facts.extend(await asyncio.to_thread(writer.keep_sources, unchanged))
+        tasks = [asyncio.create_task(stage()) for stage in (load, split, embed, upsert)]
+        await asyncio.gather(*tasks)
+        print(f"Extracted {len(facts)} budget facts from tables.")
+        if corpus is not None:
+            failed = [path for path, entry in corpus["files"].items() if entry.get("status") == 'failed']
+            for path in failed:
+                print(f"Failed to read {path}: {corpus['files'][path].get('error')}")
+            # A file that could not be read keeps whatever the previous version had for it,
+            # instead of the pages read before it failed.
+            facts = [fact for fact in facts if fact.source not in failed]
+            await asyncio.to_thread(writer.drop_sources, failed)
+            facts.extend(await asyncio.to_thread(writer.keep_sources, failed))
+        await asyncio.to_thread(writer.commit, facts, corpus)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions = True)
+        await asyncio.to_thread(writer.discard)
+        raise
+
+def save_keyword_neighbours(db, path: str):
+    """Run the fixed numerical keyword searches once per build and store the hit IDs with the index"""
+    neighbours = {keyword: [doc.id for doc in db.similarity_search(keyword, k=2)] for keyword in NUMERICAL_KEYWORDS}
+    with open(os.path.join(path, KEYWORD_NEIGHBOURS), 'w') as f:
+        json.dump(neighbours, f)
+
+def keyword_neighbours(db) -> Optional[dict[str, list[Document]]]:
+    """Keyword result sets for the live index version, or None if the index predates them"""
+    def load(path):
+        with open(path) as f:
+            ids_by_keyword = json.load(f)
+        all_ids = list(dict.fromkeys(cid for ids in ids_by_keyword.values() for cid in ids))
+        by_id = {doc.id: doc for doc in db.get_by_ids(all_ids)}
+        return {
+            keyword: [by_id[cid] for cid in ids if cid in by_id]
+            for keyword, ids in ids_by_keyword.items()
+        }
+
+    return load_index_artifact(KEYWORD_NEIGHBOURS, load)
+
+def format_budget_facts(query_text: str, facts: list[BudgetProgram]) -> str:
+    response = f"QUERY: {query_text}\n\nBUDGET TABLE FACTS FOUND:\n\n"
+    for i, fact in enumerate(facts):
+        if abs(fact.funding_request) >= 1:
+            amount = f"${fact.funding_request:,.3f} billion"
+        else:
+            amount = f"${fact.funding_request * 1000:,.1f} million"
+        response += f"--- Fact {i+1} (Source: {fact.source or 'Unknown'}, page {fact.page}) ---\n"
+        response += f"Program: {fact.name}\nOffice: {fact.office}\nFY {fact.fiscal_year} {fact.basis}: {amount}\n\n"
+    return response
+
+def ask_numerical_questions(query_text, query_vector: Optional[list[float]] = None, mode: Optional[str] = None):
     if not query_text.strip():
         return "Please provide a valid question."
-    if not os.path.exists(CHROMA):
+    if not vector_store.exists():
         return "Database not found! Please run with '--build' option first."
 
     try:
-        db = Chroma(persist_directory = CHROMA, embedding_function = embeddings)
-        semantic_res = db.similarity_search(query_text, k=3)
-        numerical_keywords = ['budget', 'million', 'billion', 'dollar', '$', '%', 'funding', 'allocation']
-        keyword_queries = [kw for kw in numerical_keywords if kw.lower() in query_text.lower()]
+        # Program/office lookups are answered straight from the fact table; anything else falls back to search.
+        fact_table = load_index_artifact(FACT_TABLE, FactTable)
+        facts = fact_table.lookup(query_text) if fact_table else []
+        if facts:
+            return format_budget_facts(query_text, facts)
+
+        db = vector_store.get()
+        semantic_res = retrieve(db, query_text, 3, query_vector, mode)
+        keyword_queries = [kw for kw in NUMERICAL_KEYWORDS if kw.lower() in query_text.lower()]
 
+        precomputed = keyword_neighbours(db)
         keyword_res = []
         for key in keyword_queries[:2]:
-            keyword_res.extend(db.similarity_search(key, k=2))
+            if precomputed is not None and key in precomputed:
+                keyword_res.extend(precomputed[key])
+            else:
+                keyword_res.extend(db.similarity_search(key, k=2))
 
-        all_res = semantic_res + keyword_res
-        seen_content = set()
-        unique_res = []
-        for doc in all_res:
-            if doc.page_content[:100] not in seen_content:
-                unique_res.append(doc)
-                seen_content.add(doc.page_content[:100])
+        unique_res = collapse_near_duplicates(expand_to_parents(semantic_res + keyword_res), NEAR_DUPLICATE_THRESHOLD)
 
         if not unique_res:
             return 'No relevant numerical data found for your query.'
@@ -117,27 +1024,107 @@ def ask_numerical_questions(query_text):
     except Exception as e:
         return f"Error occured while processing numerical query: {str(e)}"
 
-async def ask_questions(query_text):
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def uncovered_spans(start: int, end: int, covered: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Parts of [start, end) not inside any of the covered intervals"""
+    spans = [(start, end)]
+    for c_start, c_end in covered:
+        next_spans = []
+        for s_start, s_end in spans:
+            if c_end <= s_start or c_start >= s_end:
+                next_spans.append((s_start, s_end))
+                continue
+            if s_start < c_start:
+                next_spans.append((s_start, c_start))
+            if c_end < s_end:
+                next_spans.append((c_end, s_end))
+        spans = next_spans
+    return spans
+
+def same_overlap(start: int, text: str, other_start: int, other_text: str) -> bool:
+    """Whether two chunks of one page hold the same text where their offsets overlap"""
+    low = max(start, other_start)
+    high = min(start + len(text), other_start + len(other_text))
+    return high <= low or text[low - start:high - start] == other_text[low - other_start:high - other_start]
+
+def pack_context(docs: list[Document], token_budget: Optional[int] = None) -> list[Document]:
+    """Drop text already covered by a more relevant chunk and pack the rest up to a token budget.
+
+    `docs` must be in relevance order. Overlap is detected from the splitter's
+    `start_index` on the same source page, so a chunk that shares half its text
+    with a neighbour only contributes its new half. Offsets are only trusted
+    where the two chunks actually agree on the text, so a stale `start_index`
+    can never cut text that is not repeated.
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    covered = {}
+    packed = []
+    used = 0
+    for doc in docs:
+        start = doc.metadata.get('start_index')
+        if start is None:
+            pieces = [(doc.page_content, None)]
+        else:
+            page_key = (doc.metadata.get('source'), doc.metadata.get('page'))
+            end = start + len(doc.page_content)
+            overlapping = [
+                (c_start, c_start + len(c_text)) for c_start, c_text in covered.get(page_key, [])
+                if same_overlap(start, doc.page_content, c_start, c_text)
+            ]
+            spans = uncovered_spans(start, end, overlapping)
+            covered.setdefault(page_key, []).append((start, doc.page_content))
+            pieces = [
+                (doc.page_content[s_start - start:s_end - start], s_start)
+                for s_start, s_end in spans
+                if s_end - s_start >= MIN_CONTEXT_CHARS
+            ]
+
+        for text, piece_start in pieces:
+            remaining = token_budget - used
+            if remaining * CHARS_PER_TOKEN < MIN_CONTEXT_CHARS:
+                return packed
+            text = text[:remaining * CHARS_PER_TOKEN]
+            metadata = dict(doc.metadata)
+            if piece_start is not None:
+                metadata['start_index'] = piece_start
+            packed.append(Document(id = doc.id, page_content = text, metadata = metadata))
+            used += estimate_tokens(text)
+    return packed
+
+def build_qa_chain(db, query_vector: Optional[list[float]] = None, mode: Optional[str] = None) -> RetrievalQAWithSourcesChain:
+    retriever = SearchRetriever(search = lambda query: pack_context(retrieve(db, query, 20, query_vector, mode)))
+
+    return RetrievalQAWithSourcesChain.from_chain_type(
+        llm=get_llm(),
+        chain_type="stuff",
+        retriever=retriever,
+        return_source_documents=True
+    )
+
+async def ask_questions(query_text, query_vector: Optional[list[float]] = None):
 
     if not query_text.strip():
         return "Please provide a valid question."
 
-    if not os.path.exists(CHROMA):
+    if not vector_store.exists():
         return "Database not found! Please run with '--build' option first."
 
     try:
-        db = Chroma(persist_directory=CHROMA, embedding_function=embeddings)
-        retriever = db.as_retriever(search_kwargs={'k': 20})
-        llm = ChatOllama(model='llama3.2:3b', temperature=0.1)
-
-        qa_chain = RetrievalQAWithSourcesChain.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True
-        )
+        if query_vector is None:
+            query_vector = await asyncio.to_thread(embeddings.embed_query, query_text)
+        index_version = vector_store.current_version()
+        cached = answer_cache.get(query_vector, index_version)
+        if cached is not None:
+            return cached
+
+        started = time.perf_counter()
+        qa_chain = build_qa_chain(vector_store.get(), query_vector)
 
-        response = qa_chain.invoke({"question": query_text})
+        # Bounded async generation: concurrent requests overlap their LLM waits without flooding Ollama.
+        async with llm_slots:
+            response = await qa_chain.ainvoke({"question": query_text})
 
         answer = response.get('answer', 'No answer found')
         sources = response.get('sources', 'No sources')
@@ -156,46 +1143,110 @@ RELEVANT EXCERPTS:
             formatted_response += f"\n--- Source {i+1} ({doc.metadata.get('source', 'Unknown')}) ---\n"
             formatted_response += doc.page_content[:400] + "...\n"
 
+        answer_cache.put(query_vector, index_version, formatted_response, time.perf_counter() - started)
         return formatted_response
 
     except Exception as e:
         return f"Error occurred while processing question: {str(e)}"
 
+async def stream_answer(query_text, query_vector: Optional[list[float]] = None):
+    """Yield (event, data) pairs: the retrieved sources first, then LLM tokens as they are generated.
+
+    Uses the same retriever, prompt and ChatOllama configuration as `ask_questions`.
+    """
+    qa_chain = build_qa_chain(vector_store.get(), query_vector)
+    docs = await qa_chain.retriever.ainvoke(query_text)
+
+    sources = list(dict.fromkeys(doc.metadata.get('source', 'Unknown') for doc in docs))
+    excerpts = [
+        {
+            "source": doc.metadata.get('source', 'Unknown'),
+            "page": doc.metadata.get('page'),
+            "content": doc.page_content[:400]
+        }
+        for doc in docs[:3]
+    ]
+    yield 'sources', {"sources": sources, "excerpts": excerpts}
+
+    stuff_chain = qa_chain.combine_documents_chain
+    inputs = stuff_chain._get_inputs(docs, question = query_text)
+    prompt = stuff_chain.llm_chain.prompt.format_prompt(**inputs)
+    async with llm_slots:
+        async for chunk in stuff_chain.llm_chain.llm.astream(prompt):
+            if chunk.content:
+                yield 'token', chunk.content
+    yield 'done', {}
+
 def main():
     parser = argparse.ArgumentParser(description="RAG system for Fiscal year 2025 justification of Department of Energy Q&A")
     parser.add_argument('--build', action='store_true', help='Build the vector database')
     parser.add_argument('--num', type = str, help = "Ask numerical/budget questions with enhanced retrieval")
     parser.add_argument('--ask', type=str, help='Ask a question (with LLM answer)')
     parser.add_argument('--query', type=str, help='Query database for similar documents (no LLM)')
+    parser.add_argument('--mode', choices = RETRIEVAL_MODES, default = None, help = 'Retrieval mode (default: dense)')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for PDF page extraction (1 = sequential loader)')
+    parser.add_argument('--corpus', type = str, default = None,
+                        help = 'Directory of PDFs, manifest (.json list or .txt lines) or single PDF to index with --build')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'Re-parse every PDF instead of using the page text cache')
+    parser.add_argument('--chunking', choices = CHUNKING_MODES, default = None,
+                        help = 'Chunking used by --build: overlapping, parent/child, token-sized or table row groups (default: overlap)')
+    parser.add_argument('--embed-batch-size', type = int, default = None,
+                        help = 'Texts per embedding model forward pass (default: the tuned size for this device, else 32)')
+    parser.add_argument('--upsert-batch-size', type = int, default = None, help = 'Chunks per embed/upsert batch in --build (default: 100)')
+    parser.add_argument('--batch-order', choices = BATCH_ORDERS, default = None,
+                        help = 'Batch chunks in document order or grouped by length to cut padding (default: arrival)')
+    parser.add_argument('--embedding-backend', choices = EMBEDDING_BACKENDS, default = None,
+                        help = 'Embed with sentence-transformers on torch or the int8 ONNX export on onnxruntime (default: torch)')
+    parser.add_argument('--tune-batch-size', action = 'store_true',
+                        help = 'Find the fastest embedding batch size on this device and save it for later runs')
 
     args = parser.parse_args()
+    if args.mode:
+        global RETRIEVAL_MODE
+        RETRIEVAL_MODE = args.mode
+    if args.embedding_backend:
+        global EMBEDDING_BACKEND
+        EMBEDDING_BACKEND = args.embedding_backend
+        # The cache was created at import time, under the default backend's ID.
+        embeddings.model_name = embedding_model_id()
+    if args.embed_batch_size:
+        global EMBEDDING_BATCH_SIZE
+        EMBEDDING_BATCH_SIZE = args.embed_batch_size
 
-    if args.build:
-        asyncio.run(build_database())
+    if args.tune_batch_size:
+        asyncio.run(tune_embedding_batch_size())
+    elif args.build:
+        asyncio.run(build_database(
+                workers = args.workers, chunking = args.chunking, corpus = args.corpus, use_cache = not args.no_cache,
+                batch_size = args.upsert_batch_size, batch_order = args.batch_order
+        ))
     elif args.num:
         response = ask_numerical_questions(args.num)
         print(response)
     elif args.ask:
-        response =  ask_questions(args.ask)
+        response = asyncio.run(ask_questions(args.ask))
         print(response)
     elif args.query:
-        query_database(args.query)
+        response = query_database(args.query)
+        if response:
+            print(response)
     else:
         print("Please specify either --build to create database or --ask to ask a question")
 
-def query_database(query_text):
+def query_database(query_text, query_vector: Optional[list[float]] = None, mode: Optional[str] = None):
     if not query_text.strip():
         print("Please provide a valid query.")
         return
 
-    if not os.path.exists(CHROMA):
+    if not vector_store.exists():
         print("Database not found! Please run with '--build' first.")
         return
 
     try:
-        db = Chroma(persist_directory = CHROMA, embedding_function = embeddings)
+        db = vector_store.get()
 
-        res = db.similarity_search(query_text, k=3)
+        # Over-fetch so that collapsing overlapping neighbours still leaves three distinct passages.
+        res = collapse_near_duplicates(retrieve(db, query_text, 6, query_vector, mode), NEAR_DUPLICATE_THRESHOLD)[:3]
         if len(res) == 0:
             print('Unable to find any matches!')
             return
@@ -207,12 +1258,114 @@ def query_database(query_text):
     except Exception as e:
         return f"Error occured while querying the database: {str(e)}"
 
-async def build_database():
+def chunking_config(chunking: str) -> dict:
+    """Settings that decide chunk boundaries and vectors; a file is only skipped when these match the last build"""
+    return {
+        "mode": chunking,
+        "parent_chunk_size": PARENT_CHUNK_SIZE,
+        "child_chunk_size": CHILD_CHUNK_SIZE,
+        "embedding_max_tokens": EMBEDDING_MAX_TOKENS,
+        "token_chunk_overlap": TOKEN_CHUNK_OVERLAP,
+        "table_parser_version": TABLE_PARSER_VERSION,
+        "embedding": embedding_model_id()
+    }
+
+def read_corpus_status() -> dict:
+    """Per-file status saved with the live index version, or an empty status"""
+    if not vector_store.exists():
+        return {}
+    path = os.path.join(vector_store.current_path(), CORPUS_STATUS)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+async def build_database(workers: int = 1, progress: Optional[BuildProgress] = None, chunking: Optional[str] = None,
+                         corpus: Optional[str] = None, use_cache: bool = True, batch_size: Optional[int] = None,
+                         batch_order: Optional[str] = None):
+    progress = progress or BuildProgress()
+    chunking = chunking or CHUNKING_MODE
     try:
-        pages = await load_data()
-        text_chunks = text_splitter(pages)
-        save_at_chroma(text_chunks)
+        progress.set_stage('load')
+        paths = discover_corpus(corpus or CORPUS or DATA)
+        if not paths:
+            raise FileNotFoundError(f"No PDF files found in {corpus or CORPUS}")
+
+        def hash_files() -> tuple[dict[str, str], dict[str, str]]:
+            hashes, errors = {}, {}
+            for path in paths:
+                try:
+                    hashes[path] = file_sha256(path)
+                except OSError as e:
+                    errors[path] = str(e)
+            return hashes, errors
+
+        # A file that cannot be read (e.g. missing from a manifest) fails on its own, like an unparseable PDF.
+        hashes, unreadable = await asyncio.to_thread(hash_files)
+        previous = read_corpus_status()
+        config = chunking_config(chunking)
+        previous_files = previous.get("files", {}) if previous.get("chunking") == config else {}
+        unchanged = [
+            path for path in hashes
+            if previous_files.get(path, {}).get("sha256") == hashes[path]
+            and previous_files[path].get("status") != 'failed'
+        ]
+        changed = [path for path in hashes if path not in unchanged]
+        progress.files = {
+            path: {"sha256": hashes[path], "status": 'unchanged' if path in unchanged else 'pending'}
+            if path in hashes else {"status": 'failed', "error": unreadable[path]}
+            for path in paths
+        }
+        print(f"Corpus: {len(paths)} files, {len(changed)} new or changed, {len(unchanged)} unchanged, "
+              f"{len(unreadable)} unreadable.")
+        # Lets the ETA be estimated from pages while the total number of chunks is still unknown.
+        counts = await asyncio.to_thread(lambda: [page_count(path) for path in changed])
+        progress.pages_total = sum(count for count in counts if count) or None
+
+        if not changed and not unreadable and set(paths) == set(previous_files):
+            print("Index is up to date.")
+        else:
+            await ingest(
+                iter_pages(workers, changed, progress.files, use_cache = use_cache, hashes = hashes), chunking, progress,
+                unchanged = unchanged, corpus = {"chunking": config, "files": progress.files},
+                batch_size = batch_size, batch_order = batch_order
+            )
+            if use_cache:
+                print(f"Page cache: {page_cache.stats()}")
+        progress.finish()
     except Exception as e:
+        progress.finish(str(e))
         print(f'Error occured while building the database: {str(e)}')
+
+async def tune_embedding_batch_size(candidates: Optional[list[int]] = None, sample: int = 256) -> int:
+    """Time the embedding model on chunks of the PDF at each candidate batch size and save the fastest for this device"""
+    pages = await load_data()
+    chunks, _ = split_pages(pages, verbose = False)
+    step = max(len(chunks) // sample, 1)
+    texts = [chunk.page_content for chunk in chunks[::step]][:sample]
+
+    # The raw model, not the cache: cached texts would make every size look equally fast.
+    model = await asyncio.to_thread(embedding_model.load)
+    configured = model.encode_kwargs.get('batch_size')
+
+    def encode(batch: list[str], size: int):
+        model.encode_kwargs['batch_size'] = size
+        model.embed_documents(batch)
+
+    try:
+        best, rates = await asyncio.to_thread(tune_batch_size, encode, texts, list(candidates or EMBEDDING_BATCH_CANDIDATES))
+    finally:
+        model.encode_kwargs['batch_size'] = configured
+
+    device = device_profile(embedding_device())
+    print(f"{'batch size':>10} {'texts/s':>9}  ({len(texts)} chunks on {device})")
+    for size, rate in rates.items():
+        print(f"{size:>10} {rate:>9.1f}{'  <- fastest' if size == best else ''}")
+    save_tuned_size(EMBEDDING_BATCH_TUNING, EMBEDDING_MODEL, device, best, rates)
+    if not EMBEDDING_BATCH_SIZE:
+        model.encode_kwargs['batch_size'] = best
+    print(f"Saved batch size {best} for {device} to {EMBEDDING_BATCH_TUNING}")
+    return best
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,75 @@
+import base64
+import hashlib
+import random
+import re
+from collections import defaultdict
+from typing import Optional
+import numpy as np
+from langchain_core.documents import Document
+
+NUM_PERMUTATIONS = 64
+ROWS_PER_BAND = 2
+SHINGLE_SIZE = 3
+MINHASH_KEY = 'minhash'
+
+_PRIME = (1 << 31) - 1
+_rng = random.Random(20250)
+_A = np.array([_rng.randrange(1, _PRIME) for _ in range(NUM_PERMUTATIONS)], dtype = np.uint64)
+_B = np.array([_rng.randrange(0, _PRIME) for _ in range(NUM_PERMUTATIONS)], dtype = np.uint64)
+
+def shingles(text: str) -> set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i+SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def minhash_signature(text: str) -> np.ndarray:
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size = 4).digest(), 'little') for s in shingles(text)],
+        dtype = np.uint64
+    )
+    if hashes.size == 0:
+        return np.full(NUM_PERMUTATIONS, _PRIME, dtype = np.uint32)
+    # a < 2^31 and h < 2^32, so a*h + b stays below 2^64.
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis = 1).astype(np.uint32)
+
+def encode_signature(signature: np.ndarray) -> str:
+    return base64.b64encode(signature.astype('<u4').tobytes()).decode('ascii')
+
+def decode_signature(encoded: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded), dtype = '<u4')
+
+def add_minhash_signatures(chunks: list[Document]) -> list[Document]:
+    """Store each chunk's MinHash signature in its metadata so queries never compare text"""
+    for chunk in chunks:
+        chunk.metadata[MINHASH_KEY] = encode_signature(minhash_signature(chunk.page_content))
+    return chunks
+
+def collapse_near_duplicates(docs: list[Document], threshold: float = 0.25) -> list[Document]:
+    """Keep the first (most relevant) of every group of near-duplicate documents.
+
+    Candidates are found through LSH bands of the stored signatures, so each
+    document is only compared with kept documents sharing a band. Documents
+    from an index built before signatures were stored are signed here, which
+    costs well under a millisecond per chunk.
+    """
+    kept = []
+    signatures = []
+    buckets = defaultdict(list)
+    for doc in docs:
+        encoded: Optional[str] = doc.metadata.get(MINHASH_KEY)
+        signature = decode_signature(encoded) if encoded else minhash_signature(doc.page_content)
+        bands = [
+            (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+            for band in range(NUM_PERMUTATIONS // ROWS_PER_BAND)
+        ]
+        candidates = {position for band in bands for position in buckets.get(band, ())}
+        if any(np.mean(signatures[position] == signature) >= threshold for position in candidates):
+            continue
+
+        position = len(signatures)
+        signatures.append(signature)
+        for band in bands:
+            buckets[band].append(position)
+        kept.append(doc)
+    return kept
@@ -0,0 +1,50 @@
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence-transformer embeddings from a quantized ONNX export, run by onnxruntime on CPU.
+
+    Reproduces the all-MiniLM-L6-v2 pipeline without torch: word pieces
+    truncated to the model window, mean pooling over the attention mask and L2
+    normalisation. Texts are sorted by length before batching, as
+    sentence-transformers does, so each batch is padded as little as possible.
+    `encode_kwargs['batch_size']` mirrors HuggingFaceEmbeddings so the batch
+    size tuner works with either backend.
+    """
+
+    def __init__(self, model_path: str, tokenizer, max_tokens: int = 256, batch_size: int = 32, threads: int = 0):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        # 0 lets onnxruntime use one thread per physical core.
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers = ['CPUExecutionProvider'])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.tokenizer = tokenizer
+        self.tokenizer.enable_truncation(max_length = max_tokens)
+        self.tokenizer.enable_padding(pad_id = tokenizer.token_to_id('[PAD]') or 0, pad_token = '[PAD]')
+        self.encode_kwargs = {'batch_size': batch_size}
+
+    def _embed_batch(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype = np.int64),
+            'attention_mask': np.array([encoding.attention_mask for encoding in encodings], dtype = np.int64),
+            'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype = np.int64)
+        }
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        mask = feeds['attention_mask'][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis = 1) / np.clip(mask.sum(axis = 1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis = 1, keepdims = True), 1e-12, None)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        batch_size = self.encode_kwargs['batch_size']
+        order = sorted(range(len(texts)), key = lambda i: -len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start+batch_size]
+            for i, vector in zip(indices, self._embed_batch([texts[i] for i in indices])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
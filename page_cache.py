@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import threading
+import zlib
+from typing import Optional
+from langchain_core.documents import Document
+
+class PageCache:
+    """SQLite cache of extracted PDF page text and metadata.
+
+    Pages are keyed by the file's content hash, the loader (name and version)
+    and the page number, and stored as zlib-compressed JSON. A file is only
+    served from the cache once all of its pages have been stored, so an
+    interrupted extraction is simply redone.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread = False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "file_hash TEXT NOT NULL, loader TEXT NOT NULL, page INTEGER NOT NULL, content BLOB NOT NULL, "
+            "PRIMARY KEY (file_hash, loader, page))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "file_hash TEXT NOT NULL, loader TEXT NOT NULL, pages INTEGER NOT NULL, "
+            "PRIMARY KEY (file_hash, loader))"
+        )
+        self._conn.commit()
+
+    def get_file(self, file_hash: str, loader: str) -> Optional[list[Document]]:
+        """All pages of a completely cached file in page order, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pages FROM files WHERE file_hash = ? AND loader = ?", (file_hash, loader)
+            ).fetchone()
+            if row is None:
+                return None
+            blobs = [blob for (blob,) in self._conn.execute(
+                "SELECT content FROM pages WHERE file_hash = ? AND loader = ? ORDER BY page", (file_hash, loader)
+            )]
+            if len(blobs) != row[0]:
+                return None
+            self.hits += len(blobs)
+
+        pages = []
+        for blob in blobs:
+            data = json.loads(zlib.decompress(blob))
+            pages.append(Document(page_content = data["text"], metadata = data["metadata"]))
+        return pages
+
+    def put_page(self, file_hash: str, loader: str, page: int, doc: Document):
+        raw = json.dumps({"text": doc.page_content, "metadata": doc.metadata}, separators = (',', ':')).encode('utf-8')
+        blob = zlib.compress(raw, 6)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (file_hash, loader, page, content) VALUES (?, ?, ?, ?)",
+                (file_hash, loader, page, blob)
+            )
+            self.misses += 1
+            self.raw_bytes += len(raw)
+            self.stored_bytes += len(blob)
+
+    def complete_file(self, file_hash: str, loader: str, pages: int):
+        """Mark a file's pages as all stored, making it servable"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_hash, loader, pages) VALUES (?, ?, ?)",
+                (file_hash, loader, pages)
+            )
+            self._conn.commit()
+
+    def prune(self, loader: str):
+        """Delete pages stored by any other loader or loader version; they can never be served again"""
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE loader != ?", (loader,))
+            self._conn.execute("DELETE FROM files WHERE loader != ?", (loader,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM files")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM pages").fetchone()
+        total = self.hits + self.misses
+        return {
+            "files": files,
+            "pages": entries,
+            "stored_bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "compression_ratio": self.raw_bytes / self.stored_bytes if self.stored_bytes else None
+        }
@@ -0,0 +1,42 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from langchain_community.document_loaders.parsers.pdf import _purge_metadata
+from langchain_core.documents import Document
+from pypdf import PdfReader
+
+def extract_page_range(path: str, start: int, stop: int) -> list[Document]:
+    """Extract pages [start, stop) of a PDF the way PyPDFLoader does. Runs inside a worker process."""
+    reader = PdfReader(path)
+    # Same document-info metadata and stripped text as PyPDFLoader, so start_index matches the sequential loader.
+    metadata = _purge_metadata(
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | dict(reader.metadata or {})
+        | {"source": path, "total_pages": len(reader.pages)}
+    )
+    pages = []
+    for i in range(start, stop):
+        pages.append(Document(
+            page_content = reader.pages[i].extract_text().strip(),
+            metadata = metadata | {'page': i, 'page_label': reader.page_labels[i]}
+        ))
+    return pages
+
+def start_extraction_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool for extract_page_range() whose workers never fork the calling process.
+
+    Forking a process with running threads (the API server's event loop helpers,
+    Chroma, the embedding warm-up) can deadlock the child. Workers are forked
+    from a single-threaded fork server instead, or spawned where there is no
+    fork server. Like spawned processes, they import the main module again, so
+    scripts that build with workers need an `if __name__ == '__main__'` guard.
+    This blocks while the workers start, so call it off the event loop.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(max_workers = workers, mp_context = context)
+    # Start the workers now rather than on the first submits from the event loop.
+    list(pool.map(int, range(workers)))
+    return pool
@@ -2,17 +2,29 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 import asyncio
+import json
 import os
+import uuid
 from datetime import datetime
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from model import (
         build_database,
+        BuildProgress,
         ask_questions,
+        stream_answer,
         ask_numerical_questions,
         query_database,
-        CHROMA
+        vector_store,
+        embedding_model,
+        embed_queries,
+        answer_cache,
+        embeddings,
+        page_cache,
+        RETRIEVAL_MODES,
+        CHROMA,
+        CHROMA_GC_INTERVAL_SECONDS
 )
 
 class QuestionRequest(BaseModel):
@@ -25,6 +37,7 @@ class BatchQuestionRequest(BaseModel):
 
 class SearchRequest(BaseModel):
     query: str
+    mode: Optional[str] = None
 
 class QuestionResponse(BaseModel):
     success: bool
@@ -46,12 +59,32 @@ class DatabaseStatus(BaseModel):
     stats: Optional[dict] = None
 
 rag_system_ready = False
+embedding_warmup = None
+BATCH_CONCURRENCY = 4
+# Processes extracting PDF pages in /database/build; pages already in the page cache need none.
+BUILD_WORKERS = os.cpu_count() or 1
+build_jobs = {}
+active_build_id = None
+
+async def collect_index_garbage():
+    # Without this, retired versions would only be deleted by the next build.
+    while True:
+        try:
+            await asyncio.to_thread(vector_store.collect_garbage)
+        except Exception as e:
+            print(f"Error removing retired index versions: {str(e)}")
+        await asyncio.sleep(CHROMA_GC_INTERVAL_SECONDS)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global rag_system_ready
+    global rag_system_ready, embedding_warmup
+    index_gc = None
     try:
-        if os.path.exists(CHROMA):
+        # Load the sentence-transformer in the background so startup isn't blocked on torch.
+        embedding_warmup = asyncio.get_running_loop().run_in_executor(None, embedding_model.load)
+        index_gc = asyncio.create_task(collect_index_garbage())
+        if vector_store.exists():
+            vector_store.get()
             rag_system_ready = True
             print("RAG system is ready - database found.")
         else:
@@ -60,6 +93,9 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"Error initializing RAG system: {str(e)}")
     finally:
+        if index_gc is not None:
+            index_gc.cancel()
+        vector_store.close()
         print("Shutting down server...")
 
 app = FastAPI(
@@ -75,18 +111,32 @@ async def health_check():
             "status":"OK",
             "timestamp": datetime.now().isoformat(),
             "service": "RAG API Server",
-            "rag_system_ready": rag_system_ready
+            "rag_system_ready": rag_system_ready,
+            "embedding_model_ready": embedding_model.is_loaded
+    }
+
+@app.get('/metrics')
+async def get_metrics():
+    return {
+            "answer_cache": answer_cache.stats(),
+            "query_embedding_cache": embeddings.query_stats(),
+            "embedding_cache": embeddings.stats(),
+            "page_cache": page_cache.stats(),
+            "timestamp": datetime.now().isoformat()
     }
 
 @app.get('/database/status', response_model=DatabaseStatus)
 async def get_database_status():
     try:
-        exists = os.path.exists(CHROMA)
+        exists = vector_store.exists()
         stats = None
+        path = CHROMA
 
         if exists:
-            stat = os.stat(CHROMA)
+            path = vector_store.current_path()
+            stat = os.stat(path)
             stats = {
+                    "version": vector_store.current_version(),
                     "created": datetime.fromtimestamp(stat.st_ctime).isoformat(),
                     "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
                     "size": stat.st_size
@@ -94,26 +144,57 @@ async def get_database_status():
 
         return DatabaseStatus(
                 database_exists = exists,
-                database_path = CHROMA,
+                database_path = path,
                 stats = stats
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to check database status: {str(e)}")
 
-@app.post('/database/build')
-async def build_vector_database():
-    global rag_system_ready
+async def run_build_job(job_id: str):
+    global rag_system_ready, active_build_id
+    progress = build_jobs[job_id]["progress"]
     try:
-        print("Building database...")
-        build_database()
-        rag_system_ready = True
-        return {
-                "success": True,
-                "message":"Database built successfully",
-                "timestamp": datetime.now().isoformat()
-        }
-    except Exception as e:
-        raise HTTPException(status_code = 500, detail = f"Failed to build database: {str(e)}")
+        await build_database(workers = BUILD_WORKERS, progress = progress)
+        if progress.stage == 'completed':
+            rag_system_ready = True
+    finally:
+        active_build_id = None
+        print(f"Build job {job_id} finished: {progress.stage}")
+
+@app.post('/database/build', status_code = 202)
+async def build_vector_database():
+    global active_build_id
+    if active_build_id is not None:
+        raise HTTPException(status_code = 409, detail = f"A build is already running: {active_build_id}")
+
+    job_id = uuid.uuid4().hex
+    active_build_id = job_id
+    build_jobs[job_id] = {
+            "progress": BuildProgress(),
+            "created": datetime.now().isoformat()
+    }
+    build_jobs[job_id]["task"] = asyncio.create_task(run_build_job(job_id))
+    print(f"Building database in background job {job_id}...")
+    return {
+            "success": True,
+            "message": "Database build started",
+            "job_id": job_id,
+            "status_url": f"/database/build/{job_id}",
+            "timestamp": datetime.now().isoformat()
+    }
+
+@app.get('/database/build/{job_id}')
+async def get_build_status(job_id: str):
+    job = build_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code = 404, detail = f"Build job not found: {job_id}")
+
+    return {
+            "job_id": job_id,
+            "created": job["created"],
+            **job["progress"].snapshot(),
+            "timestamp": datetime.now().isoformat()
+    }
 
 @app.post('/ask', response_model = QuestionResponse)
 async def ask_question(request: QuestionRequest):
@@ -126,10 +207,10 @@ async def ask_question(request: QuestionRequest):
     try:
         print(f"Processing question: {request.question}")
         if request.type == 'numerical':
-            result = ask_numerical_question(request.question)
+            result = await asyncio.to_thread(ask_numerical_questions, request.question)
             parsed_res = {"raw_output": result}
         elif request.type == 'query':
-            res = query_database(request.question)
+            res = await asyncio.to_thread(query_database, request.question)
             parsed_res = {"raw_output": res}
         else:
             res = await ask_questions(request.question)
@@ -186,19 +267,41 @@ async def ask_question(request: QuestionRequest):
                 error = str(e)
         )
 
-async def process_single_question(question: str, question_type: str = "standard"):
+@app.post('/ask/stream')
+async def ask_question_stream(request: QuestionRequest):
+    """Stream an answer as Server-Sent Events: one `sources` event, then `token` events, then `done`"""
+    if not rag_system_ready:
+        raise HTTPException(status_code=503, detail='RAG system not ready. Build database first.')
+
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail = 'Question cannot be empty')
+
+    async def event_stream():
+        try:
+            async for event, data in stream_answer(request.question):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+
+    return StreamingResponse(
+            event_stream(),
+            media_type = "text/event-stream",
+            headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def process_single_question(question: str, question_type: str = "standard", query_vector: Optional[List[float]] = None):
     """Process a single question and return the result"""
     try:
         print(f"Processing question ({question_type}): {question}")
 
         if question_type == "numerical":
-            result = ask_numerical_questions(question)
+            result = await asyncio.to_thread(ask_numerical_questions, question, query_vector)
             parsed_result = {"raw_output": result}
         elif question_type == "query":
-            result = query_database(question)
+            result = await asyncio.to_thread(query_database, question, query_vector)
             parsed_result = {"raw_output": result}
         else:  # standard
-            result = await ask_questions(question)
+            result = await ask_questions(question, query_vector)
             # Try to parse structured response
             try:
                 lines = result.split('\n')
@@ -261,16 +364,31 @@ async def ask_batch_questions(request: BatchQuestionRequest):
     if len(request.questions) > 10:
         raise HTTPException(status_code=400, detail="Maximum 10 questions allowed per batch")
 
-    results = []
     question_type = request.type or "standard"
 
     print(f"Processing {len(request.questions)} questions with type: {question_type}")
 
-    for i, question in enumerate(request.questions):
-        print(f"Processing batch question {i + 1}/{len(request.questions)}")
-        result = await process_single_question(question, question_type)
-        results.append(result)
-        print(f"Completed question {i + 1}, success: {result.get('success', False)}")
+    # One batched embedding call for every question's retrieval.
+    try:
+        query_vectors = await asyncio.to_thread(embed_queries, request.questions)
+    except Exception as e:
+        print(f"Batched embedding failed, embedding per question: {str(e)}")
+        query_vectors = [None] * len(request.questions)
+
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_question(i: int, question: str, query_vector):
+        async with slots:
+            print(f"Processing batch question {i + 1}/{len(request.questions)}")
+            result = await process_single_question(question, question_type, query_vector)
+            print(f"Completed question {i + 1}, success: {result.get('success', False)}")
+            return result
+
+    # gather() keeps results in the original question order.
+    results = await asyncio.gather(*[
+        run_question(i, question, query_vector)
+        for i, (question, query_vector) in enumerate(zip(request.questions, query_vectors))
+    ])
 
     response = BatchResponse(
         success=True,
@@ -290,9 +408,12 @@ async def search_documents(request: SearchRequest):
     if not request.query.strip():
         raise HTTPException(status_code = 400, detail = "Query cannot be empty.")
 
+    if request.mode is not None and request.mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code = 400, detail = f"mode must be one of: {', '.join(RETRIEVAL_MODES)}")
+
     try:
         print(f"Searching for: {request.query}")
-        res = query_database(request.query)
+        res = await asyncio.to_thread(query_database, request.query, None, request.mode)
 
         return {
                 "success": True,
@@ -310,9 +431,12 @@ async def root():
             "version": "1.0.0",
             "endpoints": {
                 "GET /health": "Check health",
+                "GET /metrics": "Cache hit rates and saved latency",
                 "GET /database/status": "Check database status",
-                "POST /database/build": "Build vector database",
+                "POST /database/build": "Start a background vector database build",
+                "GET /database/build/{job_id}": "Check build progress",
                 "POST /ask": "Ask questions with sources",
+                "POST /ask/stream": "Ask a question and stream the answer (SSE)",
                 "POST /ask/batch": "Ask multiple questions",
                 "POST /search" : "Search similar documents",
                 "GET /docs": "API documentation (Swagger UI)"
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+SPECIAL_TOKENS = 2  # [CLS] and [SEP] take two positions of the model window.
+
+def load_tokenizer(model_name: str):
+    from tokenizers import Tokenizer
+    tokenizer = Tokenizer.from_pretrained(model_name)
+    # The hub config truncates and pads; counting needs the raw lengths.
+    tokenizer.no_truncation()
+    tokenizer.no_padding()
+    return tokenizer
+
+class TokenCounter:
+    """Counts word pieces with the embedding model's tokenizer.
+
+    The tokenizer (the Rust `tokenizers` one, not torch) is loaded on first use.
+    Counts are kept in an LRU cache because the recursive splitter measures the
+    same pieces again when it merges them, and `count_many` encodes every miss
+    in one batch.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 100_000, factory: Callable = None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.factory = factory or (lambda: load_tokenizer(model_name))
+        self.hits = 0
+        self.misses = 0
+        self._tokenizer = None
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    self._tokenizer = self.factory()
+        return self._tokenizer
+
+    def _remember(self, text: str, count: int):
+        self._counts[text] = count
+        while len(self._counts) > self.max_entries:
+            self._counts.popitem(last = False)
+
+    def count(self, text: str) -> int:
+        with self._lock:
+            count = self._counts.get(text)
+            if count is not None:
+                self._counts.move_to_end(text)
+                self.hits += 1
+                return count
+        count = len(self.tokenizer.encode(text, add_special_tokens = False).ids)
+        with self._lock:
+            self.misses += 1
+            self._remember(text, count)
+        return count
+
+    def count_many(self, texts: list[str]) -> list[int]:
+        with self._lock:
+            counts = {text: self._counts[text] for text in texts if text in self._counts}
+        missing = list(dict.fromkeys(text for text in texts if text not in counts))
+        if missing:
+            encodings = self.tokenizer.encode_batch(missing, add_special_tokens = False)
+            counts.update((text, len(encoding.ids)) for text, encoding in zip(missing, encodings))
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            for text in missing:
+                self._remember(text, counts[text])
+        return [counts[text] for text in texts]
+
+    def truncated_chars(self, texts: list[str], max_tokens: int) -> list[int]:
+        """Characters of each text past the first `max_tokens` word pieces, i.e. never seen by the model"""
+        encodings = self.tokenizer.encode_batch(texts, add_special_tokens = False)
+        return [
+            len(text) - encoding.offsets[max_tokens - 1][1] if len(encoding.ids) > max_tokens else 0
+            for text, encoding in zip(texts, encodings)
+        ]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._counts),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
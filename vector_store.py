@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Optional
+from langchain_chroma.vectorstores import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+MANIFEST = 'CURRENT.json'
+VERSIONS = 'versions'
+LEGACY_VERSION = 'legacy'
+
+class VectorStoreManager:
+    """Process-wide Chroma handle shared by every request path.
+
+    Each build is written into its own directory under `<root>/versions/` and
+    published by atomically replacing the `CURRENT.json` manifest. Open handles
+    keep reading the version they were opened on, so in-flight queries finish
+    on the old index while new requests pick up the new one. Superseded versions
+    are deleted once they have been retired for `retention_seconds`, and the
+    handle still open on them is released then, since Chroma keeps every
+    client's system alive until it is closed.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function: Embeddings, retention_seconds: float = 3600):
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.retention_seconds = retention_seconds
+        self._db = None
+        self._db_version = None
+        self._retired_dbs = {}
+        self._lock = threading.Lock()
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.persist_directory, MANIFEST)
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Stores built before versioning keep their files directly in the root.
+            if os.path.exists(os.path.join(self.persist_directory, 'chroma.sqlite3')):
+                return {"version": LEGACY_VERSION, "path": self.persist_directory, "retired": {}}
+            return {"version": None, "path": None, "retired": {}}
+
+    def _write_manifest(self, manifest: dict):
+        tmp_path = f"{self._manifest_path()}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent = 2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path())
+
+    def current_version(self) -> Optional[str]:
+        return self._read_manifest()["version"]
+
+    def current_path(self) -> Optional[str]:
+        return self._read_manifest()["path"]
+
+    def exists(self) -> bool:
+        return self.current_version() is not None
+
+    def get(self) -> Chroma:
+        manifest = self._read_manifest()
+        if manifest["version"] is None:
+            raise FileNotFoundError(f"No vector database found in {self.persist_directory}")
+
+        with self._lock:
+            if self._db is None or self._db_version != manifest["version"]:
+                self._retire_handle()
+                db = self._retired_dbs.pop(manifest["version"], None)
+                self._db = db if db is not None else self.open_version(manifest["path"])
+                self._db_version = manifest["version"]
+            return self._db
+
+    def open_version(self, path: str) -> Chroma:
+        return Chroma(persist_directory = path, embedding_function = self.embedding_function)
+
+    def release(self, db: Chroma):
+        """Close a handle from `open_version()`, stopping its Chroma system once no other handle uses it"""
+        db._client.close()
+
+    def _retire_handle(self):
+        # Queries may still be running on the old handle, so it is closed when its version is deleted.
+        if self._db is not None:
+            self._retired_dbs[self._db_version] = self._db
+        self._db = None
+        self._db_version = None
+
+    def stage_version(self, seed: bool = True) -> tuple[str, str]:
+        """Create a new version directory, by default seeded with a copy of the current one.
+
+        Seeding lets incremental ingestion diff against the live index without touching it.
+        """
+        version = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(self.persist_directory, VERSIONS, version)
+        current_path = self.current_path()
+        if current_path and seed:
+            shutil.copytree(current_path, path, ignore = shutil.ignore_patterns(VERSIONS, MANIFEST, '*.tmp'))
+        else:
+            os.makedirs(path)
+        return version, path
+
+    def publish(self, version: str, path: str):
+        """Atomically point CURRENT.json at a staged version and retire the previous one"""
+        with self._lock:
+            manifest = self._read_manifest()
+            retired = dict(manifest.get("retired", {}))
+            if manifest["version"] is not None:
+                retired[manifest["version"]] = time.time()
+            self._write_manifest({
+                "version": version,
+                "path": path,
+                "created": datetime.now().isoformat(),
+                "retired": retired
+            })
+        self.reload()
+        self.collect_garbage()
+
+    def discard(self, path: str):
+        shutil.rmtree(path, ignore_errors = True)
+
+    def collect_garbage(self) -> list[str]:
+        """Delete versions that were retired more than `retention_seconds` ago"""
+        removed = []
+        with self._lock:
+            manifest = self._read_manifest()
+            retired = dict(manifest.get("retired", {}))
+            now = time.time()
+            for version, retired_at in list(retired.items()):
+                if now - retired_at < self.retention_seconds:
+                    continue
+                if version == LEGACY_VERSION:
+                    for entry in os.listdir(self.persist_directory):
+                        if entry in (VERSIONS, MANIFEST) or entry.endswith('.tmp'):
+                            continue
+                        entry_path = os.path.join(self.persist_directory, entry)
+                        if os.path.isdir(entry_path):
+                            shutil.rmtree(entry_path, ignore_errors = True)
+                        else:
+                            os.remove(entry_path)
+                else:
+                    shutil.rmtree(os.path.join(self.persist_directory, VERSIONS, version), ignore_errors = True)
+                del retired[version]
+                removed.append(version)
+            if removed:
+                manifest["retired"] = retired
+                self._write_manifest(manifest)
+            # Also covers versions another process has already deleted.
+            for version in [version for version in self._retired_dbs if version not in retired]:
+                self.release(self._retired_dbs.pop(version))
+        if removed:
+            print(f"Removed retired index versions: {', '.join(removed)}")
+        return removed
+
+    def reload(self):
+        """Drop the current handle so the next `get()` opens the published version"""
+        with self._lock:
+            self._retire_handle()
+
+    def close(self):
+        """Release every open handle, e.g. on shutdown"""
+        with self._lock:
+            self._retire_handle()
+            for db in self._retired_dbs.values():
+                self.release(db)
+            self._retired_dbs = {}
+
+class SearchRetriever(BaseRetriever):
+    """Retriever backed by a plain search function, e.g. dense search with a precomputed vector or hybrid search"""
+
+    search: Callable[[str], list[Document]]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        return self.search(query)